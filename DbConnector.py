@@ -1,6 +1,9 @@
 import os
 from dotenv import load_dotenv
 import mysql.connector as mysql
+from mysql.connector import pooling
+
+from embedded_backend import FILE_EXTENSIONS, EmbeddedConnection
 
 load_dotenv()
 PASSWORD = os.getenv('PASSWORD')
@@ -10,22 +13,44 @@ class DbConnector:
     Connects to the MySQL server on the Ubuntu virtual machine.
     Connector needs HOST, DATABASE, USER and PASSWORD to connect,
     while PORT is optional and should be 3306.
+    With BACKEND "sqlite" or "duckdb" it opens an embedded database file instead, and no server is needed.
 
     Example:
     HOST = "tdt4225-00.idi.ntnu.no" // Your server IP address/domain name
     DATABASE = "testdb" // Database name, if you just want to connect to MySQL server, leave it empty
     USER = "testuser" // This is the user you created and added privileges for
     PASSWORD = "test123" // The password you set for said user
+    ALLOW_LOCAL_INFILE = False // Set to True to allow LOAD DATA LOCAL INFILE (bulk load mode)
+    POOL_SIZE = 5 // Number of extra pooled connections handed out by get_connection(), at most 32
+    BACKEND = "mysql" // Or "sqlite" / "duckdb": the database is then the file DATABASE + ".sqlite" / ".duckdb"
     """
 
     def __init__(self,
                  HOST="0.0.0.0",
                  DATABASE="local_db",
                  USER="root",
-                 PASSWORD=PASSWORD):
+                 PASSWORD=PASSWORD,
+                 ALLOW_LOCAL_INFILE=False,
+                 POOL_SIZE=5,
+                 BACKEND="mysql"):
+        self.config = {"host": HOST, "database": DATABASE, "user": USER, "password": PASSWORD, "port": 3306,
+                       "allow_local_infile": ALLOW_LOCAL_INFILE}
+        self.pool_size = POOL_SIZE
+        self.backend = BACKEND
+        # The pool is only created the first time get_connection() is called
+        self.pool = None
+
+        if BACKEND != "mysql":
+            self.db_connection = EmbeddedConnection(BACKEND, DATABASE + FILE_EXTENSIONS.get(BACKEND, ""))
+            self.cursor = self.db_connection.cursor()
+            print("Connected to:", self.db_connection.get_server_info())
+            print("You are connected to the database file:", self.db_connection.database_file)
+            print("-----------------------------------------------\n")
+            return
+
         # Connect to the database
         try:
-            self.db_connection = mysql.connect(host=HOST, database=DATABASE, user=USER, password=PASSWORD, port=3306)
+            self.db_connection = mysql.connect(**self.config)
         except Exception as e:
             print("ERROR: Failed to connect to db:", e)
 
@@ -39,6 +64,22 @@ class DbConnector:
         print("You are connected to the database:", database_name)
         print("-----------------------------------------------\n")
 
+    def get_connection(self):
+        # Hands out a pooled connection after a health check; a connection the server has dropped
+        # is reconnected. Calling close() on it returns it to the pool.
+        if self.backend != "mysql":
+            return self.db_connection.new_connection()
+        if self.pool is None:
+            self.pool = pooling.MySQLConnectionPool(pool_name="geolife_pool", pool_size=self.pool_size,
+                                                    **self.config)
+        connection = self.pool.get_connection()
+        try:
+            connection.ping(reconnect=True, attempts=3, delay=1)
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
     def close_connection(self):
         # close the cursor
         self.cursor.close()
@@ -46,4 +87,32 @@ class DbConnector:
         self.db_connection.close()
         print("\n-----------------------------------------------")
         print("Connection to %s is closed" % self.db_connection.get_server_info())
-        
\ No newline at end of file
+        
+
+
+class PooledConnector:
+    """
+    One connection borrowed from a DbConnector's pool, with the same db_connection and cursor
+    attributes as DbConnector, so an ExampleProgram can run on a worker thread's own connection.
+    connection_id is what KILL QUERY needs to cancel the statement it is running.
+
+    Example:
+    connector = DbConnector(POOL_SIZE=4)
+    worker = PooledConnector(connector)
+    program = ExampleProgram(connection=worker)
+    worker.close_connection() // returns the connection to the pool
+    """
+
+    def __init__(self, CONNECTOR):
+        self.connector = CONNECTOR
+        self.pool_size = CONNECTOR.pool_size
+        self.db_connection = CONNECTOR.get_connection()
+        self.connection_id = self.db_connection.connection_id
+        self.cursor = self.db_connection.cursor()
+
+    def get_connection(self):
+        return self.connector.get_connection()
+
+    def close_connection(self):
+        self.cursor.close()
+        self.db_connection.close()
@@ -0,0 +1,138 @@
+from contextlib import redirect_stdout
+import argparse
+import io
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from DbConnector import DbConnector, PASSWORD
+from geolife import ExampleProgram
+import synthetic_dataset
+from task_runner import TASKS
+
+
+def peak_rss_mb() -> dict[str, float]:
+    # ru_maxrss is in kilobytes on Linux; children covers the parser worker processes.
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    ordered = sorted(samples)
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    return {
+        "min": ordered[0],
+        "p50": pick(0.5),
+        "p90": pick(0.9),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+        "mean": statistics.fmean(ordered),
+    }
+
+
+def timed(function, *args, **kwargs) -> float:
+    # Runs quietly: the progress output would otherwise be part of the measurement.
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def count_rows(program: ExampleProgram) -> dict[str, int]:
+    counts = {}
+    for table_name in ("User", "Activity", "TrackPoint"):
+        program.cursor.execute("SELECT COUNT(*) FROM %s" % table_name)
+        counts[table_name] = program.cursor.fetchone()[0]
+    return counts
+
+
+def run(args) -> dict:
+    report = {
+        "commit": subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip(),
+        "parameters": {name: value for name, value in vars(args).items() if name != "password"},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        report["dataset"] = synthetic_dataset.generate(
+            directory, args.users, args.files_per_user, args.points_per_file,
+            args.invalid_share, args.labelled_share, args.seed)
+        connection = DbConnector(HOST=args.host, DATABASE=args.database, USER=args.user, PASSWORD=args.password,
+                                 ALLOW_LOCAL_INFILE=args.loader == "load_data", BACKEND=args.backend)
+        program = ExampleProgram(dataset_directory=directory, connection=connection,
+                                 profile_queries=args.profile_queries, cache_results=args.cache_results)
+        try:
+            ingest = {}
+            for table_name in ("CalendarBucket", "TaskResult", "DataGeneration", "IngestedLabels", "IngestedFile",
+                               "ActivitySummary", "TrackPoint", "Activity", "User"):
+                timed(program.drop_table, table_name)
+            ingest["create_tables"] = timed(program.create_tables)
+            ingest["manifest"] = timed(lambda: program.manifest)
+            ingest["insert_user_data"] = timed(program.insert_user_data)
+            if args.legacy:
+                ingest["insert_activity_data"] = timed(program.insert_activity_data)
+                ingest["insert_trackpoint_data"] = timed(program.insert_trackpoint_data)
+                ingest_seconds = ingest["insert_activity_data"] + ingest["insert_trackpoint_data"]
+            else:
+                ingest["insert_activity_and_trackpoint_data"] = timed(
+                    program.insert_activity_and_trackpoint_data, processes=args.processes,
+                    loader=args.loader, writers=args.writers)
+                ingest_seconds = ingest["insert_activity_and_trackpoint_data"]
+            rows = count_rows(program)
+            report["ingest"] = {
+                "seconds": ingest,
+                "rows": rows,
+                "trackpoints_per_second": rows["TrackPoint"] / ingest_seconds if ingest_seconds else None,
+                "files_per_second": report["dataset"]["files"] / ingest_seconds if ingest_seconds else None,
+            }
+            report["tasks"] = {}
+            for task in args.tasks:
+                samples = [timed(getattr(program, task)) for _ in range(args.repeat)]
+                report["tasks"][task] = percentiles(samples)
+            report["metrics"] = program.metrics.to_dict()
+        finally:
+            program.connection.close_connection()
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest and tasks on a synthetic Geolife dataset")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--files-per-user", type=int, default=20)
+    parser.add_argument("--points-per-file", type=int, default=500)
+    parser.add_argument("--invalid-share", type=float, default=0.1)
+    parser.add_argument("--labelled-share", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=["mysql", "sqlite", "duckdb"], default="mysql")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--database", default="benchmark_db")
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default=PASSWORD)
+    parser.add_argument("--legacy", action="store_true", help="use insert_activity_data + insert_trackpoint_data")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--loader", choices=["executemany", "load_data"], default="executemany")
+    parser.add_argument("--writers", type=int, default=1)
+    parser.add_argument("--tasks", nargs="*", default=TASKS, choices=TASKS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cache-results", action="store_true",
+                        help="let repeated task runs hit the result cache (off: every run recomputes)")
+    parser.add_argument("--profile-queries", action="store_true", help="record EXPLAIN ANALYZE of each task query")
+    parser.add_argument("--output", default=None, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    report = run(args)
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Splits activity intervals across calendar buckets and returns, per bucket, how many activities
+# touch it and how many hours of them fall inside it. An activity belongs to every bucket from the
+# one containing its start up to and including the one containing its end, the same rule as
+# YEAR(start_date_time) .. YEAR(end_date_time) in the original task_6a.
+UNITS = {"year": "Y", "month": "M", "week": "W", "day": "D", "hour": "h"}
+# numpy counts weeks from Thursday 1970-01-01; shifting by three days makes them start on Monday.
+WEEK_SHIFT_DAYS = 3
+
+
+def bucket_ids(times: np.ndarray, unit: str) -> np.ndarray:
+    # datetime64[s] values to integer bucket numbers.
+    if unit == "week":
+        return (times.astype("datetime64[D]").astype(np.int64) + WEEK_SHIFT_DAYS) // 7
+    return times.astype("datetime64[%s]" % UNITS[unit]).astype(np.int64)
+
+
+def bucket_starts(ids: np.ndarray, unit: str) -> np.ndarray:
+    if unit == "week":
+        return (ids * 7 - WEEK_SHIFT_DAYS).astype("datetime64[D]").astype("datetime64[s]")
+    return ids.astype("datetime64[%s]" % UNITS[unit]).astype("datetime64[s]")
+
+
+def bucket_label(start: datetime, unit: str):
+    if unit == "year":
+        return start.year
+    if unit == "month":
+        return start.strftime("%Y-%m")
+    if unit == "hour":
+        return start.strftime("%Y-%m-%d %H:00")
+    return start.strftime("%Y-%m-%d")
+
+
+def floor_datetime(value: datetime, unit: str) -> datetime:
+    return bucket_starts(bucket_ids(np.array([value], dtype="datetime64[s]"), unit), unit)[0].astype(datetime)
+
+
+def next_bucket(start: datetime, unit: str) -> datetime:
+    if unit == "year":
+        return start.replace(year=start.year + 1)
+    if unit == "month":
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start + {"week": timedelta(weeks=1), "day": timedelta(days=1), "hour": timedelta(hours=1)}[unit]
+
+
+class CalendarBuckets:
+    """
+    Accumulates activity counts and hours per calendar bucket (year, month, week, day or hour).
+    add() takes start and end arrays and splits every interval across its buckets with NumPy,
+    so Activity can be streamed through it one fetchmany() chunk at a time.
+
+    Example:
+    buckets = CalendarBuckets("month")
+    buckets.add(starts, ends) // datetime64 arrays or lists of datetimes
+    buckets.rows() // [("2008-05", 12, 30.5), ...] ordered by bucket
+    """
+
+    def __init__(self, UNIT="year"):
+        if UNIT not in UNITS:
+            raise ValueError("Unknown bucket unit %r, expected one of %s" % (UNIT, ", ".join(UNITS)))
+        self.unit = UNIT
+        self.counts: dict[int, int] = {}
+        self.seconds: dict[int, float] = {}
+
+    def add(self, starts, ends) -> None:
+        starts = np.asarray(starts, dtype="datetime64[s]")
+        ends = np.asarray(ends, dtype="datetime64[s]")
+        if len(starts) == 0:
+            return
+        first = bucket_ids(starts, self.unit)
+        spans = bucket_ids(ends, self.unit) - first + 1
+        # One row per (activity, bucket) pair: the activity's first bucket plus 0, 1, ... spans - 1.
+        activity = np.repeat(np.arange(len(starts)), spans)
+        offsets = np.arange(len(activity)) - np.repeat(np.cumsum(spans) - spans, spans)
+        ids = first[activity] + offsets
+        bucket_start = bucket_starts(ids, self.unit)
+        bucket_end = bucket_starts(ids + 1, self.unit)
+        overlap = (np.minimum(ends[activity], bucket_end) - np.maximum(starts[activity], bucket_start))
+        overlap = np.maximum(overlap.astype(np.int64), 0)
+        unique_ids, index = np.unique(ids, return_inverse=True)
+        counts = np.bincount(index, minlength=len(unique_ids))
+        seconds = np.bincount(index, weights=overlap, minlength=len(unique_ids))
+        for bucket, count, total in zip(unique_ids.tolist(), counts.tolist(), seconds.tolist()):
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+            self.seconds[bucket] = self.seconds.get(bucket, 0.0) + total
+
+    def rows(self) -> list[tuple]:
+        # (bucket label, activity count, hours) per bucket, in calendar order.
+        ids = np.array(sorted(self.counts), dtype=np.int64)
+        starts = bucket_starts(ids, self.unit).astype(datetime) if len(ids) else []
+        return [(bucket_label(start, self.unit), self.counts[bucket], self.seconds[bucket] / 3600)
+                for bucket, start in zip(ids.tolist(), starts)]
+
+
+def calendar_rows(first: datetime, last: datetime, unit: str) -> list[tuple[str, datetime, datetime]]:
+    # (unit, bucket_start, bucket_end) for every bucket from the one containing first to the one containing last.
+    rows = []
+    start = floor_datetime(first, unit)
+    while start <= last:
+        end = next_bucket(start, unit)
+        rows.append((unit, start, end))
+        start = end
+    return rows
+
+
+# The same split done by the database against the generated CalendarBucket table.
+CALENDAR_BUCKETS_SQL = """
+SELECT
+    CalendarBucket.bucket_start,
+    COUNT(*) AS activity_count,
+    SUM(TIMESTAMPDIFF(SECOND,
+                      GREATEST(Activity.start_date_time, CalendarBucket.bucket_start),
+                      LEAST(Activity.end_date_time, CalendarBucket.bucket_end))) / 3600.0 AS hours
+FROM Activity
+JOIN CalendarBucket ON CalendarBucket.unit = %s
+    AND CalendarBucket.bucket_start <= Activity.end_date_time
+    AND CalendarBucket.bucket_end > Activity.start_date_time
+GROUP BY CalendarBucket.bucket_start
+ORDER BY CalendarBucket.bucket_start;
+"""
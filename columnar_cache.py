@@ -0,0 +1,171 @@
+from datetime import datetime
+import argparse
+import json
+import os
+
+import numpy as np
+from tabulate import tabulate
+
+import trajectory
+
+# TrackPoint is exported ordered by (activity_id, date_time), one raw binary file per column.
+# An activity's points are the slice offsets[i]:offsets[i + 1] of every column, so opening the
+# files with numpy.memmap lets an analysis read one activity or one user without copying.
+COLUMNS = {
+    "activity_id": np.int32,
+    "lat": np.float64,
+    "lon": np.float64,
+    "altitude": np.int32,
+    "epoch_seconds": np.int64,
+}
+DEFAULT_DIRECTORY = "dataset/cache"
+
+
+def export_trackpoints(db_connection, directory: str = DEFAULT_DIRECTORY, fetch_size: int = 100000) -> int:
+    # Streams TrackPoint out of MySQL in fetchmany chunks, appending each chunk to the column
+    # files, then writes the activity offset index. Returns the number of points exported.
+    os.makedirs(directory, exist_ok=True)
+    files = {name: open(os.path.join(directory, name + ".bin"), "wb") for name in COLUMNS}
+    activity_ids = []
+    counts = []
+    point_count = 0
+    cursor = db_connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT activity_id, lat, lon, altitude, date_time
+            FROM TrackPoint
+            ORDER BY activity_id, date_time
+        """)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            chunk = {
+                "activity_id": np.array(columns[0], dtype=np.int32),
+                "lat": np.array(columns[1], dtype=np.float64),
+                "lon": np.array(columns[2], dtype=np.float64),
+                "altitude": np.array(columns[3], dtype=np.int32),
+                "epoch_seconds": np.array(columns[4], dtype="datetime64[s]").astype(np.int64),
+            }
+            for name, values in chunk.items():
+                values.tofile(files[name])
+            ids, starts = np.unique(chunk["activity_id"], return_index=True)
+            ends = np.append(starts[1:], len(rows))
+            for activity_id, count in zip(ids.tolist(), (ends - starts).tolist()):
+                if activity_ids and activity_ids[-1] == activity_id:
+                    counts[-1] += count
+                else:
+                    activity_ids.append(activity_id)
+                    counts.append(count)
+            point_count += len(rows)
+    finally:
+        cursor.close()
+        for file in files.values():
+            file.close()
+
+    cursor = db_connection.cursor()
+    try:
+        cursor.execute("SELECT id, user_id, transportation_mode FROM Activity")
+        activities = {row[0]: row[1:] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+    np.save(os.path.join(directory, "activity_ids.npy"), np.array(activity_ids, dtype=np.int32))
+    np.save(os.path.join(directory, "offsets.npy"), np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]))
+    np.save(os.path.join(directory, "user_ids.npy"),
+            np.array([activities[activity_id][0] for activity_id in activity_ids], dtype=str))
+    np.save(os.path.join(directory, "transportation_modes.npy"),
+            np.array([activities[activity_id][1] or "" for activity_id in activity_ids], dtype=str))
+    with open(os.path.join(directory, "meta.json"), "w") as file:
+        json.dump({"point_count": point_count, "exported_at": datetime.now().isoformat()}, file)
+    return point_count
+
+
+class TrackPointCache:
+    """
+    Read-only view of a TrackPoint export written by export_trackpoints().
+    Every column is a numpy.memmap, so slicing out an activity or a user touches only
+    those pages of the files and needs no database connection.
+
+    Example:
+    cache = TrackPointCache("dataset/cache")
+    cache.activity_points(42)["lat"] // memmap slice, no copy
+    cache.total_distance("112", 2008, "walk")
+    """
+
+    def __init__(self, DIRECTORY=DEFAULT_DIRECTORY):
+        with open(os.path.join(DIRECTORY, "meta.json"), "r") as file:
+            self.point_count = json.load(file)["point_count"]
+        self.columns = {
+            name: np.memmap(os.path.join(DIRECTORY, name + ".bin"), dtype=dtype, mode="r", shape=(self.point_count,))
+            if self.point_count else np.empty(0, dtype=dtype)
+            for name, dtype in COLUMNS.items()
+        }
+        self.activity_ids = np.load(os.path.join(DIRECTORY, "activity_ids.npy"))
+        self.offsets = np.load(os.path.join(DIRECTORY, "offsets.npy"))
+        self.user_ids = np.load(os.path.join(DIRECTORY, "user_ids.npy"))
+        self.transportation_modes = np.load(os.path.join(DIRECTORY, "transportation_modes.npy"))
+        self.activity_index = {activity_id: i for i, activity_id in enumerate(self.activity_ids.tolist())}
+
+    def activity_points(self, activity_id: int) -> dict[str, np.ndarray]:
+        i = self.activity_index[activity_id]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return {name: column[start:end] for name, column in self.columns.items()}
+
+    def user_activity_ids(self, user_id: str) -> list[int]:
+        return self.activity_ids[self.user_ids == user_id].tolist()
+
+    def user_points(self, user_id: str) -> list[dict[str, np.ndarray]]:
+        return [self.activity_points(activity_id) for activity_id in self.user_activity_ids(user_id)]
+
+    def point_users(self) -> np.ndarray:
+        # The user id of every point, expanded from the activity index.
+        return np.repeat(self.user_ids, np.diff(self.offsets))
+
+    def total_distance(self, user_id: str, year: int, transportation_mode: str) -> float:
+        # task_7 against the cache: points of the user's activities with that mode, inside the year.
+        start = np.datetime64(f"{year}-01-01", "s").astype(np.int64)
+        end = np.datetime64(f"{year + 1}-01-01", "s").astype(np.int64)
+        total = 0.0
+        selected = (self.user_ids == user_id) & (self.transportation_modes == transportation_mode)
+        for activity_id in self.activity_ids[selected].tolist():
+            points = self.activity_points(activity_id)
+            in_year = (points["epoch_seconds"] >= start) & (points["epoch_seconds"] < end)
+            lat, lon = points["lat"][in_year], points["lon"][in_year]
+            total += float(trajectory.haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum())
+        return total
+
+    def altitude_gain_per_user(self) -> list[tuple[str, float]]:
+        # task_8 against the cache: positive deltas between consecutive valid altitudes per activity.
+        valid = self.columns["altitude"] != -777
+        altitude = self.columns["altitude"][valid].astype(np.float64)
+        activity = self.columns["activity_id"][valid]
+        users = self.point_users()[valid]
+        deltas = np.diff(altitude)
+        climbing = (deltas > 0) & (activity[1:] == activity[:-1])
+        names, index = np.unique(users[1:][climbing], return_inverse=True)
+        gains = np.bincount(index, weights=deltas[climbing], minlength=len(names))
+        return sorted(zip(names.tolist(), gains.tolist()), key=lambda x: x[1], reverse=True)
+
+    def gapped_activities(self, threshold_minutes: int = 5) -> list[tuple[str, int]]:
+        # task_9 against the cache: activities with consecutive points threshold_minutes or more apart.
+        activity = self.columns["activity_id"]
+        gaps = (np.diff(self.columns["epoch_seconds"]) >= threshold_minutes * 60) & (activity[1:] == activity[:-1])
+        invalid = np.isin(self.activity_ids, np.unique(activity[1:][gaps]))
+        names, counts = np.unique(self.user_ids[invalid], return_counts=True)
+        return sorted(zip(names.tolist(), counts.tolist()), reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run tasks 7-9 against an exported TrackPoint cache")
+    parser.add_argument("--directory", default=DEFAULT_DIRECTORY)
+    args = parser.parse_args()
+    cache = TrackPointCache(args.directory)
+    print(f"Total distance walked in 2008 by user 112: {cache.total_distance('112', 2008, 'walk')} km")
+    print(tabulate(cache.altitude_gain_per_user()[:20], headers=["id", "total meters gained per user"],
+                   floatfmt=".4f"))
+    print(tabulate(cache.gapped_activities(), headers=["user_id", "invalid_activity_count"]))
+
+
+if __name__ == '__main__':
+    main()
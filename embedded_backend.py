@@ -0,0 +1,341 @@
+from datetime import datetime
+import csv
+import itertools
+import math
+import os
+import re
+import sqlite3
+import tempfile
+
+# Embedded alternatives to the MySQL server behind DbConnector(BACKEND="sqlite" | "duckdb").
+# EmbeddedConnection and EmbeddedCursor have the parts of the mysql.connector API this project
+# uses, and translate the MySQL statements it sends, so ExampleProgram runs on them unchanged:
+# %s parameters, INSERT IGNORE and REPLACE, CREATE TABLE with inline indexes, AUTO_INCREMENT
+# and partitions, LOAD DATA LOCAL INFILE, KILL QUERY, TIMESTAMPDIFF, SHOW TABLES, SHOW INDEX,
+# ALTER TABLE ... ADD INDEX and DESCRIBE.
+BACKENDS = ("sqlite", "duckdb")
+FILE_EXTENSIONS = {"sqlite": ".sqlite", "duckdb": ".duckdb"}
+# DuckDB's executemany() runs one statement per row; plain inserts of more rows than this are
+# written to a temporary file and loaded with COPY instead.
+DUCKDB_COPY_THRESHOLD = 100
+TIMESTAMPDIFF_SECONDS = {"SECOND": 1, "MINUTE": 60, "HOUR": 3600, "DAY": 86400, "WEEK": 604800}
+
+SKIPPED = re.compile(r"^\s*(SET\s+(foreign_key_checks|unique_checks)\b|ALTER\s+TABLE\s+\w+\s+(DISABLE|ENABLE)\s+KEYS)",
+                     re.IGNORECASE)
+CREATE_TABLE = re.compile(r"^\s*CREATE\s+TABLE\s+IF\s+NOT\s+EXISTS\s+(\w+)\s*\(", re.IGNORECASE)
+LOAD_DATA = re.compile(r"LOAD\s+DATA\s+LOCAL\s+INFILE\s+'(.*?)'\s+INTO\s+TABLE\s+(\w+).*\(([^()]*)\)\s*;?\s*$",
+                       re.IGNORECASE | re.DOTALL)
+SHOW_INDEX = re.compile(r"^SHOW\s+INDEX\s+FROM\s+(\w+)$", re.IGNORECASE)
+ADD_INDEX = re.compile(r"^ALTER\s+TABLE\s+(\w+)\s+ADD\s+INDEX\s+(\w+)\s*(\(.*\))$", re.IGNORECASE | re.DOTALL)
+KILL_QUERY = re.compile(r"^\s*KILL\s+QUERY\s+(\d+)\s*;?\s*$", re.IGNORECASE)
+TIMESTAMPDIFF = re.compile(r"TIMESTAMPDIFF\(\s*(SECOND|MINUTE|HOUR|DAY|WEEK)\s*,", re.IGNORECASE)
+DATETIME_TEXT = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$")
+PLAIN_INSERT = re.compile(r"^\s*INSERT\s+INTO\s+(\w+)\s*\(([^()]*)\)\s*VALUES", re.IGNORECASE)
+
+DUCKDB_TIMESTAMPDIFF_MACRO = """
+CREATE OR REPLACE TEMP MACRO mysql_timestampdiff(unit, a, b) AS
+CAST(trunc((epoch(b) - epoch(a)) / CASE unit %s END) AS BIGINT)
+""" % " ".join("WHEN '%s' THEN %d" % item for item in TIMESTAMPDIFF_SECONDS.items())
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+
+
+def split_top_level(text: str) -> list[str]:
+    # Splits a column list on the commas that are not inside parentheses.
+    items, depth, current = [], 0, ""
+    for character in text:
+        if character == "," and depth == 0:
+            items.append(current.strip())
+            current = ""
+            continue
+        depth += {"(": 1, ")": -1}.get(character, 0)
+        current += character
+    if current.strip():
+        items.append(current.strip())
+    return items
+
+
+def translate_create_table(query: str, backend: str) -> list[str]:
+    # One CREATE TABLE in MySQL syntax to the statements creating the same table on the backend.
+    table = CREATE_TABLE.match(query).group(1)
+    start = query.index("(")
+    depth = 0
+    for end in range(start, len(query)):
+        depth += {"(": 1, ")": -1}.get(query[end], 0)
+        if depth == 0:
+            break
+    statements, columns, indexes = [], [], []
+    auto_increment = None
+    for item in split_top_level(query[start + 1:end]):
+        words = item.split()
+        if words[0].upper() == "INDEX":
+            indexes.append("CREATE INDEX IF NOT EXISTS %s ON %s %s" % (words[1], table, " ".join(words[2:])))
+        elif words[0].upper() == "FOREIGN" and backend == "duckdb":
+            # DuckDB checks foreign keys eagerly within a transaction, which the delete-then-reload
+            # paths of sync_data() trip over; the relations are still enforced on MySQL.
+            continue
+        elif "AUTO_INCREMENT" in item.upper():
+            auto_increment = words[0]
+            if backend == "sqlite":
+                columns.append("%s INTEGER PRIMARY KEY AUTOINCREMENT" % auto_increment)
+            else:
+                sequence = "%s_%s_sequence" % (table, auto_increment)
+                statements.append("CREATE SEQUENCE IF NOT EXISTS %s" % sequence)
+                columns.append("%s INTEGER DEFAULT nextval('%s') NOT NULL" % (auto_increment, sequence))
+        elif words[0].upper() == "PRIMARY" and auto_increment and backend == "sqlite":
+            continue
+        else:
+            columns.append(re.sub(r"\bMEDIUMTEXT\b", "TEXT", item, flags=re.IGNORECASE))
+    # Whatever follows the column list, e.g. PARTITION BY, is MySQL specific and dropped.
+    statements.append("CREATE TABLE IF NOT EXISTS %s (\n    %s\n)" % (table, ",\n    ".join(columns)))
+    # DuckDB scans columns with min/max zone maps; its ART indexes only slow the bulk loads down.
+    if backend == "sqlite":
+        statements.extend(indexes)
+    return statements
+
+
+def translate(query: str, backend: str) -> list[str]:
+    # A MySQL statement to the statements to run on the backend; [] for session settings that
+    # have no counterpart there.
+    if SKIPPED.match(query):
+        return []
+    if CREATE_TABLE.match(query):
+        return translate_create_table(query, backend)
+    stripped = query.strip().rstrip(";").strip()
+    # Index listings have MySQL's SHOW INDEX layout as far as it is used: the name is column 2.
+    show_index = SHOW_INDEX.match(stripped)
+    if show_index and backend == "sqlite":
+        return ["SELECT tbl_name, 1, name FROM sqlite_master WHERE type = 'index' AND tbl_name = '%s'"
+                % show_index.group(1)]
+    if show_index:
+        return ["SELECT table_name, NOT is_unique, index_name FROM duckdb_indexes() WHERE table_name = '%s'"
+                % show_index.group(1)]
+    add_index = ADD_INDEX.match(stripped)
+    if add_index:
+        # Like the inline indexes of CREATE TABLE: built on sqlite, left to zone maps on DuckDB.
+        table, name, columns = add_index.groups()
+        return ["CREATE INDEX IF NOT EXISTS %s ON %s %s" % (name, table, columns)] if backend == "sqlite" else []
+    if backend == "sqlite":
+        if stripped.upper() == "SHOW TABLES":
+            return ["SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"]
+        if stripped.upper().startswith("DESCRIBE "):
+            return ["SELECT name, type, \"notnull\", dflt_value, pk FROM pragma_table_info('%s')" % stripped.split()[1]]
+        if stripped.upper().startswith("EXPLAIN ANALYZE "):
+            stripped = "EXPLAIN QUERY PLAN " + stripped[len("EXPLAIN ANALYZE "):]
+    stripped = re.sub(r"\bINSERT\s+IGNORE\s+INTO\b", "INSERT OR IGNORE INTO", stripped, flags=re.IGNORECASE)
+    stripped = re.sub(r"^REPLACE\s+INTO\b", "INSERT OR REPLACE INTO", stripped, flags=re.IGNORECASE)
+    stripped = TIMESTAMPDIFF.sub(lambda m: "mysql_timestampdiff('%s'," % m.group(1).upper(), stripped)
+    return [stripped.replace("%s", "?")]
+
+
+def to_datetime(value):
+    return value if isinstance(value, datetime) or value is None else datetime.fromisoformat(str(value))
+
+
+def sqlite_row(row):
+    # SQLite only converts DATETIME columns it knows the declared type of, not e.g. MIN(date_time)
+    # or LAG(date_time); MySQL returns datetime objects for those too.
+    if row is None or not any(isinstance(value, str) for value in row):
+        return row
+    return tuple(datetime.fromisoformat(value) if isinstance(value, str) and DATETIME_TEXT.match(value) else value
+                 for value in row)
+
+
+def sqlite_timestampdiff(unit: str, start, end):
+    if start is None or end is None:
+        return None
+    return int((to_datetime(end) - to_datetime(start)).total_seconds() / TIMESTAMPDIFF_SECONDS[unit])
+
+
+def sqlite_greatest(*values):
+    return None if any(value is None for value in values) else max(values)
+
+
+def sqlite_least(*values):
+    return None if any(value is None for value in values) else min(values)
+
+
+def register_sqlite_functions(connection: sqlite3.Connection) -> None:
+    connection.create_function("YEAR", 1, lambda value: None if value is None else to_datetime(value).year,
+                               deterministic=True)
+    connection.create_function("mysql_timestampdiff", 3, sqlite_timestampdiff, deterministic=True)
+    connection.create_function("GREATEST", -1, sqlite_greatest, deterministic=True)
+    connection.create_function("LEAST", -1, sqlite_least, deterministic=True)
+    # Math functions are only built into SQLite when compiled with SQLITE_ENABLE_MATH_FUNCTIONS.
+    try:
+        connection.execute("SELECT SQRT(4), FLOOR(1.5)")
+    except sqlite3.OperationalError:
+        for name, function in (("FLOOR", math.floor), ("SQRT", math.sqrt), ("ASIN", math.asin), ("SIN", math.sin),
+                               ("COS", math.cos), ("RADIANS", math.radians), ("POW", math.pow)):
+            connection.create_function(name, -1, lambda *args, f=function: None if None in args else f(*args),
+                                       deterministic=True)
+
+
+class EmbeddedConnection:
+    """
+    A SQLite or DuckDB database file behind the mysql.connector connection API used by DbConnector.
+    Like MySQL with autocommit off, changes are only visible to other connections after commit().
+
+    Example:
+    connection = EmbeddedConnection("duckdb", "local_db.duckdb")
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM TrackPoint WHERE activity_id = %s", (42,))
+    worker = connection.new_connection() // second connection to the same file, e.g. for a writer thread
+    """
+
+    connection_ids = itertools.count(1)
+    # connection_id -> connection, so KILL QUERY can interrupt another thread's statement.
+    open_connections: dict[int, "EmbeddedConnection"] = {}
+
+    def __init__(self, BACKEND="sqlite", DATABASE_FILE="local_db.sqlite", PARENT=None):
+        if BACKEND not in BACKENDS:
+            raise ValueError("Unknown embedded backend %r, expected one of %s" % (BACKEND, ", ".join(BACKENDS)))
+        self.backend = BACKEND
+        self.database_file = DATABASE_FILE
+        self.in_transaction = False
+        if BACKEND == "sqlite":
+            self.raw = sqlite3.connect(DATABASE_FILE, timeout=60, check_same_thread=False,
+                                       detect_types=sqlite3.PARSE_DECLTYPES)
+            register_sqlite_functions(self.raw)
+            self.version = "SQLite " + sqlite3.sqlite_version
+        else:
+            try:
+                import duckdb
+            except ImportError:
+                raise ImportError("BACKEND=\"duckdb\" needs the duckdb package: pip install duckdb")
+            # Connections to one DuckDB file must come from the same database instance.
+            self.raw = PARENT.raw.cursor() if PARENT is not None else duckdb.connect(DATABASE_FILE)
+            self.raw.execute(DUCKDB_TIMESTAMPDIFF_MACRO)
+            self.version = "DuckDB " + duckdb.__version__
+        self.connection_id = next(self.connection_ids)
+        self.open_connections[self.connection_id] = self
+
+    def new_connection(self) -> "EmbeddedConnection":
+        return EmbeddedConnection(self.backend, self.database_file, PARENT=self)
+
+    def cursor(self, **kwargs) -> "EmbeddedCursor":
+        return EmbeddedCursor(self)
+
+    def begin(self) -> None:
+        # sqlite3 opens transactions implicitly; DuckDB autocommits unless told otherwise.
+        if self.backend == "duckdb" and not self.in_transaction:
+            self.raw.execute("BEGIN TRANSACTION")
+            self.in_transaction = True
+
+    def commit(self) -> None:
+        if self.backend == "sqlite":
+            self.raw.commit()
+        elif self.in_transaction:
+            self.raw.execute("COMMIT")
+            self.in_transaction = False
+
+    def rollback(self) -> None:
+        if self.backend == "sqlite":
+            self.raw.rollback()
+        elif self.in_transaction:
+            self.raw.execute("ROLLBACK")
+            self.in_transaction = False
+
+    def interrupt(self) -> None:
+        self.raw.interrupt()
+
+    def get_server_info(self) -> str:
+        return self.version
+
+    def close(self) -> None:
+        self.open_connections.pop(self.connection_id, None)
+        self.rollback()
+        self.raw.close()
+
+
+class EmbeddedCursor:
+    """
+    Cursor of an EmbeddedConnection. Statements are translated from MySQL before they run;
+    results are fetched with fetchone(), fetchmany() and fetchall() as from a mysql.connector cursor.
+    """
+
+    def __init__(self, CONNECTION):
+        self.connection = CONNECTION
+        # sqlite3 cursors are independent; DuckDB results belong to the connection, which is also
+        # how an unbuffered mysql.connector cursor behaves.
+        self.raw = CONNECTION.raw.cursor() if CONNECTION.backend == "sqlite" else CONNECTION.raw
+        self.description = None
+        self.rowcount = -1
+
+    @property
+    def column_names(self) -> tuple[str, ...]:
+        return tuple(column[0] for column in self.description or ())
+
+    def execute(self, query: str, params=()) -> None:
+        kill = KILL_QUERY.match(query)
+        if kill:
+            connection = EmbeddedConnection.open_connections.get(int(kill.group(1)))
+            if connection is not None:
+                connection.interrupt()
+            return
+        load = LOAD_DATA.match(query.strip())
+        if load:
+            path, table, columns = load.groups()
+            self.load_file(path.replace("\\\\", "\\"), table, [column.strip() for column in columns.split(",")])
+            return
+        for statement in translate(query, self.connection.backend):
+            self.connection.begin()
+            self.raw.execute(statement, list(params or ()))
+        self.description = self.raw.description
+        self.rowcount = getattr(self.raw, "rowcount", -1)
+
+    def executemany(self, query: str, rows) -> None:
+        rows = list(rows)
+        if not rows:
+            return
+        insert = PLAIN_INSERT.match(query)
+        if self.connection.backend == "duckdb" and insert and len(rows) > DUCKDB_COPY_THRESHOLD:
+            self.copy_rows(insert.group(1), [column.strip() for column in insert.group(2).split(",")], rows)
+            return
+        self.connection.begin()
+        for statement in translate(query, self.connection.backend):
+            self.raw.executemany(statement, [list(row) for row in rows])
+
+    def copy_rows(self, table: str, columns: list[str], rows) -> None:
+        # The DuckDB bulk path, and LOAD DATA for DuckDB: rows to a temporary TSV, then COPY.
+        with tempfile.NamedTemporaryFile("w", suffix=".tsv", delete=False, newline="") as file:
+            writer = csv.writer(file, delimiter="\t", lineterminator="\n")
+            for row in rows:
+                writer.writerow(["\\N" if value is None else value for value in row])
+        try:
+            self.copy_file(file.name, table, columns)
+        finally:
+            os.remove(file.name)
+
+    def copy_file(self, path: str, table: str, columns: list[str]) -> None:
+        self.connection.begin()
+        self.raw.execute("COPY %s (%s) FROM '%s' (FORMAT csv, DELIMITER '\t', NULLSTR '\\N', HEADER false)"
+                         % (table, ", ".join(columns), path.replace("'", "''")))
+
+    def load_file(self, path: str, table: str, columns: list[str]) -> None:
+        # LOAD DATA LOCAL INFILE of the tab separated files written by ExampleProgram.load_data_infile().
+        if self.connection.backend == "duckdb":
+            self.copy_file(path, table, columns)
+            return
+        with open(path, "r", newline="") as file:
+            rows = [[None if value == "\\N" else value for value in row]
+                    for row in csv.reader(file, delimiter="\t")]
+        self.executemany("INSERT INTO %s (%s) VALUES (%s)"
+                         % (table, ", ".join(columns), ", ".join(["%s"] * len(columns))), rows)
+
+    def fetchone(self):
+        row = self.raw.fetchone()
+        return sqlite_row(row) if self.connection.backend == "sqlite" else row
+
+    def fetchmany(self, size: int = 1) -> list[tuple]:
+        rows = self.raw.fetchmany(size)
+        return [sqlite_row(row) for row in rows] if self.connection.backend == "sqlite" else rows
+
+    def fetchall(self) -> list[tuple]:
+        rows = self.raw.fetchall()
+        return [sqlite_row(row) for row in rows] if self.connection.backend == "sqlite" else rows
+
+    def close(self) -> None:
+        if self.connection.backend == "sqlite":
+            self.raw.close()
@@ -0,0 +1,95 @@
+from contextlib import nullcontext
+from datetime import datetime
+import json
+import os
+import time
+
+from plt_parser import scan_plt_file
+
+
+class FileManifest:
+    """
+    Persistent manifest of every .plt file in the dataset, saved as JSON next to the dataset.
+    For each file it keeps size, mtime, line count, validity and first and last timestamp,
+    so the tree does not have to be re-read on every start. refresh() only re-validates
+    files whose size or mtime changed since the manifest was written.
+
+    Example:
+    manifest = FileManifest()
+    manifest.refresh()
+    manifest.valid_files() // {"dataset/dataset/Data/000/Trajectory/...plt": True, ...}
+    """
+
+    def __init__(self,
+                 DATA_DIRECTORY="dataset/dataset/Data",
+                 MANIFEST_FILE="dataset/dataset/manifest.json"):
+        self.data_directory = DATA_DIRECTORY
+        self.manifest_file = MANIFEST_FILE
+        self.entries: dict[str, dict] = {}
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file, 'r') as file:
+                self.entries = json.load(file)
+            for entry in self.entries.values():
+                for key in ("first", "last"):
+                    if entry[key] is not None:
+                        entry[key] = datetime.fromisoformat(entry[key])
+
+    def refresh(self, metrics=None) -> tuple[list[str], list[str], list[str]]:
+        # Returns the (new, changed, deleted) paths compared with the saved manifest.
+        # With a Metrics object, time spent scanning files is recorded as "validate" and the
+        # rest of the directory walk as "walk".
+        start = time.perf_counter()
+        validate_seconds = metrics.phases.get("validate", {}).get("seconds", 0.0) if metrics else 0.0
+        new, changed = [], []
+        seen = set()
+        for dirpath, dirnames, filenames in os.walk(self.data_directory):
+            for filename in filenames:
+                if filename.endswith('.plt'):
+                    full_path = os.path.join(dirpath, filename)
+                    seen.add(full_path)
+                    stat = os.stat(full_path)
+                    entry = self.entries.get(full_path)
+                    if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                        continue
+                    (new if entry is None else changed).append(full_path)
+                    with metrics.phase("validate") if metrics else nullcontext():
+                        line_count, valid, first, last = scan_plt_file(full_path)
+                    if metrics:
+                        metrics.count("files_validated")
+                    self.entries[full_path] = {
+                        "size": stat.st_size,
+                        "mtime": stat.st_mtime,
+                        "line_count": line_count,
+                        "valid": valid,
+                        "first": first,
+                        "last": last,
+                    }
+        deleted = [full_path for full_path in self.entries if full_path not in seen]
+        for full_path in deleted:
+            del self.entries[full_path]
+        if new or changed or deleted or not os.path.exists(self.manifest_file):
+            self.save()
+        if metrics:
+            validate_seconds = metrics.phases.get("validate", {}).get("seconds", 0.0) - validate_seconds
+            metrics.add_time("walk", time.perf_counter() - start - validate_seconds)
+            metrics.count("files_seen", len(seen))
+        return new, changed, deleted
+
+    def save(self) -> None:
+        entries = {
+            full_path: {**entry,
+                        "first": entry["first"].isoformat() if entry["first"] else None,
+                        "last": entry["last"].isoformat() if entry["last"] else None}
+            for full_path, entry in self.entries.items()
+        }
+        temporary_file = self.manifest_file + ".tmp"
+        with open(temporary_file, 'w') as file:
+            json.dump(entries, file)
+        os.replace(temporary_file, self.manifest_file)
+
+    def valid_files(self) -> dict[str, bool]:
+        return {full_path: entry["valid"] for full_path, entry in self.entries.items()}
+
+    def first_last_datetime(self, full_path: str) -> tuple[datetime | None, datetime | None]:
+        entry = self.entries[full_path]
+        return entry["first"], entry["last"]
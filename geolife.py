@@ -1,23 +1,98 @@
 from DbConnector import DbConnector
+from file_manifest import FileManifest
+from label_index import LabelIndex
+from metrics import Metrics
+from result_cache import ResultCache, encode_value
+from simplify import Simplification
+from spatial import GRID_CELL_SQL, bbox_predicate, grid_cell, radius_predicate
+from time_filters import range_predicate, year_partitions_sql, year_range
+from plt_parser import parse_plt_file, parse_timestamp, read_first_last_datetime
+import calendar_buckets
+import columnar_cache
+import trajectory
 from tabulate import tabulate
-from datetime import datetime
+from datetime import datetime, timedelta
 from itertools import islice
-from haversine import haversine
+from multiprocessing import Pool
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import argparse
+import json
 import os
+import tempfile
+import time
+
+
+def summarize_activity(rows: list[tuple], simplification: Simplification | None = None) -> tuple[list[tuple], tuple]:
+    # The rows to store and their ActivitySummary figures. Without a simplification every row is
+    # kept, so the original point count equals point_count and the errors are zero.
+    if simplification is not None:
+        return simplification.apply(rows)
+    return rows, (*trajectory.summarize_rows(rows), len(rows), 0.0, 0.0)
+
+
+def parse_and_summarize_plt_file(full_path: str, simplification: Simplification | None = None) -> tuple:
+    # Worker process entry point: parse_plt_file plus the ActivitySummary figures of the file,
+    # with the optional simplification applied to the rows that are returned.
+    full_path, valid, start_time, end_time, rows = parse_plt_file(full_path)
+    summary = None
+    if valid:
+        rows, summary = summarize_activity(rows, simplification)
+    return full_path, valid, start_time, end_time, rows, summary
+
+
+# Columns and indexes added to tables after they were first released. CREATE TABLE IF NOT EXISTS
+# leaves an existing table as it was, so create_tables() adds whichever of these it lacks.
+ADDED_COLUMNS = {
+    "TrackPoint": [("grid_cell", "BIGINT")],
+    "ActivitySummary": [
+        ("original_point_count", "INT"),
+        ("distance_error_km", "DOUBLE"),
+        ("altitude_gain_error", "DOUBLE"),
+    ],
+}
+ADDED_INDEXES = {
+    "Activity": [("user_time_index", "user_id, start_date_time")],
+    "TrackPoint": [
+        ("grid_cell_index", "grid_cell, activity_id"),
+        ("activity_time_index", "activity_id, date_time"),
+    ],
+}
 
 
 class ExampleProgram:
 
-    def __init__(self):
-        self.connection = DbConnector()
+    def __init__(self, allow_local_infile: bool = False, pool_size: int = 5,
+                 dataset_directory: str = "dataset/dataset", connection: DbConnector | None = None,
+                 profile_queries: bool = False, cache_results: bool = True, backend: str = "mysql",
+                 label_tolerance_seconds: int = 0):
+        self.connection = connection or DbConnector(ALLOW_LOCAL_INFILE=allow_local_infile, POOL_SIZE=pool_size,
+                                                    BACKEND=backend)
         self.db_connection = self.connection.db_connection
         self.cursor = self.connection.cursor
-        # Comment out the two lines directly below after using functions: insert_activity_data(), 
-        # insert_trackpoint_data(), insert_user_data() as these slow down class initialization.
-        self.users_with_labels: list[str] = self.initialize_users_with_labels()
-        self.valid_files: dict[str, bool] = self.initialize_valid_files()
+        self.dataset_directory = dataset_directory
+        self.data_directory = os.path.join(dataset_directory, "Data")
+        # Like the manifest, labeled_ids.txt is only read once something needs the labels, so the
+        # tasks run against a database without the dataset on disk.
+        self._label_index: LabelIndex | None = None
+        # Activities without an exact label take the closest label whose start and end are both
+        # within this many seconds of theirs; 0 keeps matching exact.
+        self.label_tolerance = timedelta(seconds=label_tolerance_seconds)
+        # The file manifest is only loaded (and refreshed) the first time an ingest method needs it.
+        self._manifest: FileManifest | None = None
+        # Phase timings, counters and task query timings; export with self.metrics.export(filename).
+        self.metrics = Metrics(PROFILE_QUERIES=profile_queries)
+        # Task reports are reused until the next ingest bumps the data generation.
+        self.result_cache = ResultCache(self.db_connection)
+        self.cache_results = cache_results
+        # Where the task_* methods print their reports; None is stdout.
+        self.output = None
 
-    def create_tables(self) -> None:
+    def create_tables(self, partition_by_year: bool = False) -> None:
+        # partition_by_year splits TrackPoint into one RANGE partition per year of date_time, so
+        # time-scoped queries only read the years they ask for. MySQL does not allow foreign keys
+        # on partitioned tables and needs the partitioning column in every unique key, so that
+        # layout has no foreign key to Activity and a primary key of (id, date_time).
         user_table_query = """CREATE TABLE IF NOT EXISTS User (
                         id VARCHAR(255) NOT NULL,
                         has_labels BOOLEAN,
@@ -31,6 +106,7 @@ class ExampleProgram:
                         start_date_time DATETIME,
                         end_date_time DATETIME,
                         PRIMARY KEY (id),
+                        INDEX user_time_index (user_id, start_date_time),
                         FOREIGN KEY (user_id) REFERENCES User(id)
                     );
                 """
@@ -41,114 +117,211 @@ class ExampleProgram:
                         lon DOUBLE,
                         altitude INT,
                         date_time DATETIME,
+                        grid_cell BIGINT,
                         PRIMARY KEY (id),
+                        INDEX grid_cell_index (grid_cell, activity_id),
+                        INDEX activity_time_index (activity_id, date_time),
                         FOREIGN KEY (activity_id) REFERENCES Activity(id)
                     );
                 """
+        if partition_by_year:
+            trackpoint_table_query = """CREATE TABLE IF NOT EXISTS TrackPoint (
+                        id INT NOT NULL AUTO_INCREMENT,
+                        activity_id INT,
+                        lat DOUBLE,
+                        lon DOUBLE,
+                        altitude INT,
+                        date_time DATETIME NOT NULL,
+                        grid_cell BIGINT,
+                        PRIMARY KEY (id, date_time),
+                        INDEX grid_cell_index (grid_cell, activity_id),
+                        INDEX activity_time_index (activity_id, date_time)
+                    ) %s;
+                """ % year_partitions_sql("date_time")
+        # Figures that are fixed once an activity is loaded, computed from its points during ingest
+        # so reports do not have to re-aggregate TrackPoint. When ingest simplifies trajectories,
+        # point_count is what TrackPoint keeps, original_point_count what the file had, and the
+        # errors are the distance and altitude gain the kept points lose; the other figures are
+        # always computed from every point of the file.
+        activity_summary_table_query = """CREATE TABLE IF NOT EXISTS ActivitySummary (
+                        activity_id INT NOT NULL,
+                        point_count INT,
+                        distance_km DOUBLE,
+                        altitude_gain DOUBLE,
+                        max_gap_seconds INT,
+                        min_lat DOUBLE,
+                        max_lat DOUBLE,
+                        min_lon DOUBLE,
+                        max_lon DOUBLE,
+                        duration_seconds INT,
+                        original_point_count INT,
+                        distance_error_km DOUBLE,
+                        altitude_gain_error DOUBLE,
+                        PRIMARY KEY (activity_id),
+                        FOREIGN KEY (activity_id) REFERENCES Activity(id)
+                    );
+                """
+        # One row per .plt file whose activity and trackpoints are committed. Written in the same
+        # transaction as the data, so it is the durable checkpoint used to resume a crashed load.
+        ingested_file_table_query = """CREATE TABLE IF NOT EXISTS IngestedFile (
+                        path VARCHAR(255) NOT NULL,
+                        activity_id INT,
+                        size BIGINT,
+                        mtime DOUBLE,
+                        PRIMARY KEY (path)
+                    );
+                """
+        # Size and mtime of every labels.txt as of the last load, so sync_data() can re-label
+        # only the users whose labels changed.
+        ingested_labels_table_query = """CREATE TABLE IF NOT EXISTS IngestedLabels (
+                        user_id VARCHAR(255) NOT NULL,
+                        size BIGINT,
+                        mtime DOUBLE,
+                        PRIMARY KEY (user_id)
+                    );
+                """
+        # A single counter bumped by every ingest, and task reports computed at a given value of it.
+        data_generation_table_query = """CREATE TABLE IF NOT EXISTS DataGeneration (
+                        id INT NOT NULL,
+                        generation BIGINT NOT NULL,
+                        PRIMARY KEY (id)
+                    );
+                """
+        # Generated bucket boundaries for activity_buckets(method="sql"), filled on demand.
+        calendar_bucket_table_query = """CREATE TABLE IF NOT EXISTS CalendarBucket (
+                        unit VARCHAR(8) NOT NULL,
+                        bucket_start DATETIME NOT NULL,
+                        bucket_end DATETIME NOT NULL,
+                        PRIMARY KEY (unit, bucket_start)
+                    );
+                """
+        task_result_table_query = """CREATE TABLE IF NOT EXISTS TaskResult (
+                        task_name VARCHAR(255) NOT NULL,
+                        parameters_hash CHAR(40) NOT NULL,
+                        parameters TEXT,
+                        generation BIGINT,
+                        result MEDIUMTEXT,
+                        PRIMARY KEY (task_name, parameters_hash)
+                    );
+                """
+        # Existing tables get their new columns first, as the inline indexes of the CREATE TABLE
+        # statements may refer to them.
+        existing_tables = self.table_names()
+        for table_name, columns in ADDED_COLUMNS.items():
+            if table_name.lower() in existing_tables:
+                self.add_missing_columns(table_name, columns)
         self.cursor.execute(user_table_query)
         self.cursor.execute(activity_table_query)
         self.cursor.execute(trackpoint_table_query)
+        self.cursor.execute(activity_summary_table_query)
+        for table_name, indexes in ADDED_INDEXES.items():
+            self.add_missing_indexes(table_name, indexes)
+        self.cursor.execute(ingested_file_table_query)
+        self.cursor.execute(ingested_labels_table_query)
+        self.cursor.execute(data_generation_table_query)
+        self.cursor.execute(calendar_bucket_table_query)
+        self.cursor.execute(task_result_table_query)
+        self.cursor.execute("INSERT IGNORE INTO DataGeneration (id, generation) VALUES (1, 0)")
         self.db_connection.commit()
 
-    def initialize_valid_files(self) -> dict[str, bool]:
-        valid_files = {}
-        for dirpath, dirnames, filenames in os.walk("dataset/dataset/Data"):
-            for filename in filenames:
-                if filename.endswith('.plt'):
-                    full_path = os.path.join(dirpath, filename)
-                    line_count = 0
-                    with open(full_path, 'r') as file:
-                        for line in file:
-                            line_count += 1
-                            if line_count > 2506:
-                                valid_files[full_path] = False
-                                break
-                    if line_count <= 2506:
-                        if line_count <= 6:
-                            valid_files[full_path] = False
-                        else:
-                            valid_files[full_path] = True
-        return valid_files
+    def table_names(self) -> set[str]:
+        self.cursor.execute("SHOW TABLES")
+        return {row[0].lower() for row in self.cursor.fetchall()}
 
-    def valid_file(self, filename: str) -> bool:
-        return self.valid_files[filename]
+    def add_missing_columns(self, table_name: str, columns: list[tuple[str, str]]) -> None:
+        # Appends the columns a table from an older version lacks. Existing rows get NULL in them.
+        self.cursor.execute("SELECT * FROM %s LIMIT 0" % table_name)
+        self.cursor.fetchall()
+        existing = {name.lower() for name in self.cursor.column_names}
+        for name, column_type in columns:
+            if name.lower() not in existing:
+                print("Adding column %s to %s" % (name, table_name))
+                self.cursor.execute("ALTER TABLE %s ADD COLUMN %s %s" % (table_name, name, column_type))
+
+    def add_missing_indexes(self, table_name: str, indexes: list[tuple[str, str]]) -> None:
+        # (index name, column list) pairs; builds the ones the table does not have yet. The embedded
+        # backends list and build indexes the way they translate CREATE TABLE, see embedded_backend.
+        self.cursor.execute("SHOW INDEX FROM %s" % table_name)
+        existing = {row[2].lower() for row in self.cursor.fetchall()}
+        for name, columns in indexes:
+            if name.lower() not in existing:
+                self.cursor.execute("ALTER TABLE %s ADD INDEX %s (%s)" % (table_name, name, columns))
+
+    def new_label_index(self) -> LabelIndex:
+        return LabelIndex(DATA_DIRECTORY=self.data_directory,
+                          LABELED_IDS_FILE=os.path.join(self.dataset_directory, "labeled_ids.txt"))
+
+    @property
+    def label_index(self) -> LabelIndex:
+        if self._label_index is None:
+            self._label_index = self.new_label_index()
+        return self._label_index
+
+    @property
+    def users_with_labels(self) -> set[str]:
+        return self.label_index.users_with_labels
 
-    def initialize_users_with_labels(self) -> list[str]:
-        users_with_labels = []
-        with open("dataset/dataset/labeled_ids.txt", "r") as file:
-            for line in file:
-                users_with_labels.append(line.strip())
-        return users_with_labels
+    @property
+    def manifest(self) -> FileManifest:
+        if self._manifest is None:
+            self._manifest = FileManifest(DATA_DIRECTORY=self.data_directory,
+                                          MANIFEST_FILE=os.path.join(self.dataset_directory, "manifest.json"))
+            self._manifest.refresh(self.metrics)
+        return self._manifest
+
+    @property
+    def valid_files(self) -> dict[str, bool]:
+        return self.manifest.valid_files()
+
+    def valid_file(self, filename: str) -> bool:
+        return self.manifest.entries[filename]["valid"]
 
     def user_has_labels(self, user_id: str) -> bool:
-        return user_id in self.users_with_labels
+        return self.label_index.has_labels(user_id)
 
     def insert_user_data(self) -> None:
+        self.result_cache.bump()
         count = 0
-        directory = "dataset/dataset/Data"
-        for entry in os.listdir(directory):
+        directory = self.data_directory
+        entries = os.listdir(directory)
+        for entry in entries:
             full_path = os.path.join(directory, entry)
             if os.path.isdir(full_path):
                 count += 1
-                print(str(count) + "/182")
+                self.metrics.progress("users", count, len(entries))
                 has_label = self.user_has_labels(user_id=entry)
                 query = "INSERT IGNORE INTO User (id, has_labels) VALUES (%s, %s)"
                 data_tuple = (entry, has_label)
                 self.cursor.execute(query, data_tuple)
             self.db_connection.commit()
+        self.result_cache.bump()
+        self.metrics.count("users", count)
 
     def find_matching_label(self, user: str, start_end_datetime: tuple[datetime, datetime]) -> str | None:
-        filename = "dataset/dataset/Data/" + user + "/labels.txt"
-
         start_time, end_time = start_end_datetime
-
-        with open(filename, 'r') as file:
-            lines = file.readlines()
-
-        for line in lines[1:]:
-            column = line.strip().split('\t')
-            label_start_time = datetime.strptime(
-                column[0], '%Y/%m/%d %H:%M:%S')
-            label_end_time = datetime.strptime(column[1], '%Y/%m/%d %H:%M:%S')
-            transportation_mode = column[2]
-
-            if label_start_time == start_time and label_end_time == end_time:
-                return transportation_mode
-
-        return None
+        with self.metrics.phase("label_match"):
+            label = self.label_index.match(user, start_time, end_time)
+            if label is None and self.label_tolerance:
+                label = self.label_index.nearest(user, start_time, end_time, self.label_tolerance)
+            return label
 
     def get_first_last_datetime(self, filename: str) -> tuple[datetime, datetime]:
-        first_datetime = None
-        last_datetime = None
-
-        with open(filename, 'r') as file:
-            for line_number, line in enumerate(file):
-                if line_number < 6:
-                    continue
-                line = line.strip()
-                fields = line.split(",")
-                if len(fields) < 7:
-                    continue
-                current_datetime = datetime.strptime(
-                    f"{fields[-2]} {fields[-1]}", '%Y-%m-%d %H:%M:%S'
-                )
-                if first_datetime is None:
-                    first_datetime = current_datetime
-                last_datetime = current_datetime
-
-        return first_datetime, last_datetime
+        if filename in self.manifest.entries:
+            return self.manifest.first_last_datetime(filename)
+        return read_first_last_datetime(filename)
 
     def insert_activity_data(self) -> None:
+        self.result_cache.bump()
         activities_to_insert = []
         count = 0
-        for dirpath, dirnames, filenames in os.walk("dataset/dataset/Data"):
+        for dirpath, dirnames, filenames in os.walk(self.data_directory):
             user = dirpath[-14:-11]
             for filename in filenames:
                 if filename.endswith('.plt'):
                     full_path = os.path.join(dirpath, filename)
                     if self.valid_file(filename=full_path):
                         count += 1
-                        print(str(count) + "/16048")
+                        self.metrics.progress("activities", count)
                         start_end_datetime = self.get_first_last_datetime(
                             filename=full_path)
                         label = None
@@ -161,28 +334,35 @@ class ExampleProgram:
         count = 0
         if activities_to_insert:
             for i in range(0, len(activities_to_insert), batch_size):
-                count += batch_size
-                print(str(count) + "/" + str(len(activities_to_insert)))
                 batch = activities_to_insert[i:i + batch_size]
+                count += len(batch)
+                self.metrics.progress("activity rows", count, len(activities_to_insert))
                 query = """
                     INSERT INTO Activity (user_id, transportation_mode, start_date_time, end_date_time)
                     VALUES (%s, %s, %s, %s);
                 """
-                self.cursor.executemany(query, batch)
-            print("Committing changes")
-            self.db_connection.commit()
+                with self.metrics.phase("insert"):
+                    self.cursor.executemany(query, batch)
+            with self.metrics.phase("commit"):
+                self.db_connection.commit()
+            self.result_cache.bump()
+            self.metrics.count("activities", len(activities_to_insert))
 
-    def insert_trackpoint_data(self) -> None:
+    def insert_trackpoint_data(self, simplification: Simplification | None = None) -> None:
+        self.result_cache.bump()
         trackpoints_to_insert = []
+        # Keyed by activity id: the lookup below maps files with equal start and end times to one activity
+        summaries_to_insert = {}
         count = 0
-        for dirpath, dirnames, filenames in os.walk("dataset/dataset/Data"):
+        for dirpath, dirnames, filenames in os.walk(self.data_directory):
             user = dirpath[-14:-11]
             for filename in filenames:
                 if filename.endswith('.plt'):
                     full_path = os.path.join(dirpath, filename)
                     if self.valid_file(filename=full_path):
                         count += 1
-                        print(str(count) + "/16048")
+                        self.metrics.progress("trackpoint files", count)
+                        self.metrics.count("bytes", self.manifest.entries[full_path]["size"])
                         start_end_datetime = self.get_first_last_datetime(
                             filename=full_path)
                         query = "SELECT id FROM Activity WHERE user_id = %s AND start_date_time = %s AND end_date_time = %s"
@@ -191,30 +371,484 @@ class ExampleProgram:
                         result = self.cursor.fetchone()
                         if result:
                             activity_id = result[0]
-                            with open(full_path, 'r') as file:
+                            file_rows = []
+                            with open(full_path, 'r') as file, self.metrics.phase("parse"):
                                 for line in islice(file, 6, None):  # Skip first 6 lines
                                     line = line.strip()
                                     fields = line.split(",")
                                     if len(fields) < 7:
                                         continue
-                                    datetime_obj = datetime.strptime(
-                                        f"{fields[5]} {fields[6]}", '%Y-%m-%d %H:%M:%S')
-                                    trackpoints_to_insert.append(
-                                        (activity_id, fields[0], fields[1], fields[3], datetime_obj))
+                                    datetime_obj = parse_timestamp(fields[5], fields[6])
+                                    file_rows.append(
+                                        (fields[0], fields[1], fields[3], datetime_obj,
+                                         grid_cell(float(fields[0]), float(fields[1]))))
+                            if file_rows:
+                                file_rows, summary = summarize_activity(file_rows, simplification)
+                                self.metrics.count("points_parsed", summary[9])
+                                trackpoints_to_insert.extend((activity_id, *row) for row in file_rows)
+                                summaries_to_insert[activity_id] = (activity_id, *summary)
         batch_size = 10000
         count = 0
         if trackpoints_to_insert:
             for i in range(0, len(trackpoints_to_insert), batch_size):
-                count += batch_size
-                print(str(count) + "/" + str(len(trackpoints_to_insert)))
                 batch = trackpoints_to_insert[i:i + batch_size]
+                count += len(batch)
+                self.metrics.progress("trackpoint rows", count, len(trackpoints_to_insert))
                 query = """
-                    INSERT INTO TrackPoint (activity_id, lat, lon, altitude, date_time)
-                    VALUES (%s, %s, %s, %s, %s);
+                    INSERT INTO TrackPoint (activity_id, lat, lon, altitude, date_time, grid_cell)
+                    VALUES (%s, %s, %s, %s, %s, %s);
                 """
-                self.cursor.executemany(query, batch)
-            print("Committing changes")
+                with self.metrics.phase("insert"):
+                    self.cursor.executemany(query, batch)
+            with self.metrics.phase("insert"):
+                self.insert_activity_summaries(list(summaries_to_insert.values()))
+            with self.metrics.phase("commit"):
+                self.db_connection.commit()
+            self.result_cache.bump()
+            self.metrics.count("trackpoints", len(trackpoints_to_insert))
+
+    def insert_activity_summaries(self, summaries: list[tuple]) -> None:
+        query = """
+            INSERT INTO ActivitySummary (activity_id, point_count, distance_km, altitude_gain, max_gap_seconds,
+                                         min_lat, max_lat, min_lon, max_lon, duration_seconds,
+                                         original_point_count, distance_error_km, altitude_gain_error)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+        """
+        self.cursor.executemany(query, summaries)
+
+    def next_activity_id(self) -> int:
+        # Activity ids are reserved on the client side, so the single writer knows the id of
+        # every activity it inserts and never has to look it up again.
+        self.cursor.execute("SELECT COALESCE(MAX(id), 0) FROM Activity")
+        return self.cursor.fetchone()[0] + 1
+
+    def ingested_files(self) -> set[str]:
+        self.cursor.execute("SELECT path FROM IngestedFile")
+        return {row[0] for row in self.cursor.fetchall()}
+
+    def ingested_file_row(self, full_path: str, activity_id: int | None) -> tuple:
+        entry = self.manifest.entries[full_path]
+        return full_path, activity_id, entry["size"], entry["mtime"]
+
+    def load_data_infile(self, table_name: str, columns: tuple[str, ...], rows: list[tuple]) -> None:
+        # Writes the rows to a temporary TSV file and hands it to MySQL's native bulk loader.
+        # Needs local_infile enabled on the server and ExampleProgram(allow_local_infile=True).
+        if not rows:
+            return
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False) as file:
+            for row in rows:
+                file.write("\t".join("\\N" if value is None else str(value) for value in row) + "\n")
+        try:
+            query = """
+                LOAD DATA LOCAL INFILE '%s' INTO TABLE %s
+                FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' (%s)
+            """
+            self.cursor.execute(query % (file.name.replace("\\", "\\\\"), table_name, ", ".join(columns)))
+        finally:
+            os.remove(file.name)
+
+    def write_trackpoint_shard(self, trackpoints: list[tuple]) -> None:
+        # Runs in a writer thread on its own pooled connection and transaction.
+        connection = self.connection.get_connection()
+        cursor = connection.cursor()
+        try:
+            query = """
+                INSERT INTO TrackPoint (activity_id, lat, lon, altitude, date_time, grid_cell)
+                VALUES (%s, %s, %s, %s, %s, %s);
+            """
+            cursor.executemany(query, trackpoints)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
+    def write_activities_and_trackpoints(self, activities: list[tuple], trackpoints: list[tuple],
+                                         summaries: list[tuple], ingested_files: list[tuple],
+                                         loader: str = "executemany",
+                                         executor: ThreadPoolExecutor | None = None, writers: int = 1) -> None:
+        if executor is not None:
+            # The activities are committed first so their ids are visible to the foreign key
+            # checks of the writer connections. The IngestedFile rows are only written once
+            # every shard has committed.
+            query = """
+                INSERT INTO Activity (id, user_id, transportation_mode, start_date_time, end_date_time)
+                VALUES (%s, %s, %s, %s, %s);
+            """
+            self.cursor.executemany(query, activities)
+            self.db_connection.commit()
+            shard_size = -(-len(trackpoints) // writers) or 1
+            futures = [executor.submit(self.write_trackpoint_shard, trackpoints[i:i + shard_size])
+                       for i in range(0, len(trackpoints), shard_size)]
+            for future in futures:
+                future.result()
+        elif loader == "load_data":
+            self.load_data_infile(
+                "Activity", ("id", "user_id", "transportation_mode", "start_date_time", "end_date_time"), activities)
+            self.load_data_infile(
+                "TrackPoint", ("activity_id", "lat", "lon", "altitude", "date_time", "grid_cell"), trackpoints)
+        else:
+            query = """
+                INSERT INTO Activity (id, user_id, transportation_mode, start_date_time, end_date_time)
+                VALUES (%s, %s, %s, %s, %s);
+            """
+            self.cursor.executemany(query, activities)
+            query = """
+                INSERT INTO TrackPoint (activity_id, lat, lon, altitude, date_time, grid_cell)
+                VALUES (%s, %s, %s, %s, %s, %s);
+            """
+            self.cursor.executemany(query, trackpoints)
+        self.insert_activity_summaries(summaries)
+        query = "INSERT INTO IngestedFile (path, activity_id, size, mtime) VALUES (%s, %s, %s, %s)"
+        self.cursor.executemany(query, ingested_files)
+
+    def disable_load_checks(self) -> None:
+        # Foreign key and unique checks are session settings, so turning them off does not end
+        # the open transaction.
+        self.cursor.execute("SET foreign_key_checks = 0")
+        self.cursor.execute("SET unique_checks = 0")
+
+    def enable_load_checks(self) -> None:
+        self.cursor.execute("SET unique_checks = 1")
+        self.cursor.execute("SET foreign_key_checks = 1")
+
+    def remove_unrecorded_activities(self) -> None:
+        # With parallel writers, activities and trackpoints are committed before their IngestedFile
+        # rows. Reserved ids only grow, so anything above the highest recorded id is left over
+        # from a crashed load and is removed before resuming. insert_activity_data() and
+        # insert_trackpoint_data() never write IngestedFile, so a database loaded by them can not
+        # be resumed or synced: every activity in it would look unrecorded.
+        self.cursor.execute("SELECT COUNT(*), COALESCE(MAX(activity_id), 0) FROM IngestedFile")
+        recorded_files, last_recorded_id = self.cursor.fetchone()
+        if recorded_files == 0:
+            self.cursor.execute("SELECT COUNT(*) FROM Activity")
+            if self.cursor.fetchone()[0] > 0:
+                raise ValueError("Activity has rows but IngestedFile is empty, so this database was not loaded "
+                                 "with checkpoints; reload it instead of resuming or syncing")
+            return
+        self.cursor.execute("SELECT id FROM Activity WHERE id > %s", (last_recorded_id,))
+        # Not committed here: the deletes go out with the first batch of the resumed load.
+        self.delete_activities([row[0] for row in self.cursor.fetchall()])
+
+    def insert_activity_and_trackpoint_data(self, processes: int | None = None, resume: bool = False,
+                                            batch_size: int = 10000, commit_size: int = 100000,
+                                            loader: str = "executemany", writers: int = 1,
+                                            simplification: Simplification | None = None) -> None:
+        # Single-pass ingest: every .plt file is parsed once by a pool of worker processes,
+        # while this process is the only one writing to the database. Trackpoints are flushed
+        # every batch_size rows and committed every commit_size rows, so memory stays flat.
+        # loader is either "executemany" or "load_data" (LOAD DATA LOCAL INFILE with checks off).
+        # With writers > 1, each trackpoint batch is sharded across that many pooled connections.
+        # A Simplification thins every activity's points in the workers before they are written.
+        if writers > 1 and loader != "executemany":
+            raise ValueError("Parallel writers only support the executemany loader")
+        if writers > self.connection.pool_size:
+            raise ValueError("writers (%d) is larger than the connection pool (%d)"
+                             % (writers, self.connection.pool_size))
+        # Bumped before the first write and again after the last commit, so neither results cached
+        # before the load nor results cached while it was half done are served afterwards. The
+        # first bump is committed with the first batch, together with any deletes a resume or
+        # sync_data() made before it; a load that fails before then rolls all of them back.
+        self.result_cache.bump(commit=False)
+        if resume:
+            self.remove_unrecorded_activities()
+        done = self.ingested_files() if resume else set()
+        files = []
+        files_to_record = []
+        # Files the manifest already knows to be invalid are never sent to the pool.
+        for full_path in sorted(self.manifest.entries):
+            if full_path in done:
+                continue
+            if not self.valid_file(filename=full_path):
+                files_to_record.append(self.ingested_file_row(full_path, None))
+                continue
+            user = os.path.basename(os.path.dirname(os.path.dirname(full_path)))
+            files.append((user, full_path))
+        if resume:
+            print("Resuming: %d files already ingested, %d left" % (len(done), len(files)))
+
+        activity_id = self.next_activity_id()
+        activities_to_insert = []
+        trackpoints_to_insert = []
+        summaries_to_insert = []
+        uncommitted = 0
+        trackpoint_count = 0
+        parsed_count = 0
+        largest_distance_error = 0.0
+        largest_altitude_gain_error = 0.0
+        count = 0
+        start = time.perf_counter()
+        if loader == "load_data":
+            self.disable_load_checks()
+        executor = ThreadPoolExecutor(max_workers=writers) if writers > 1 else None
+        try:
+            # Files are handed to the pool in windows so finished results never pile up in memory
+            # faster than the writer can flush them.
+            window = 64 * (processes or os.cpu_count() or 1)
+            with Pool(processes=processes) as pool:
+                for w in range(0, len(files), window):
+                    window_files = files[w:w + window]
+                    results = pool.imap(partial(parse_and_summarize_plt_file, simplification=simplification),
+                                        [full_path for _, full_path in window_files], chunksize=4)
+                    # Time spent waiting on the workers is the parse phase as seen by the writer.
+                    for (user, _), result in zip(window_files, self.metrics.timed_iter("parse", results)):
+                        full_path, valid, start_time, end_time, rows, summary = result
+                        count += 1
+                        self.metrics.progress("files", count, len(files))
+                        self.metrics.count("files")
+                        self.metrics.count("bytes", self.manifest.entries[full_path]["size"])
+                        if not valid:
+                            self.metrics.count("invalid_files")
+                            files_to_record.append(self.ingested_file_row(full_path, None))
+                            continue
+                        label = None
+                        if self.user_has_labels(user_id=user):
+                            label = self.find_matching_label(
+                                user=user, start_end_datetime=(start_time, end_time))
+                        activities_to_insert.append((activity_id, user, label, start_time, end_time))
+                        trackpoints_to_insert.extend((activity_id, *row) for row in rows)
+                        summaries_to_insert.append((activity_id, *summary))
+                        parsed_count += summary[9]
+                        largest_distance_error = max(largest_distance_error, abs(summary[10]))
+                        largest_altitude_gain_error = max(largest_altitude_gain_error, abs(summary[11]))
+                        files_to_record.append(self.ingested_file_row(full_path, activity_id))
+                        activity_id += 1
+                        if len(trackpoints_to_insert) >= batch_size:
+                            uncommitted += len(trackpoints_to_insert)
+                            trackpoint_count += len(trackpoints_to_insert)
+                            self.metrics.count("activities", len(activities_to_insert))
+                            self.metrics.count("trackpoints", len(trackpoints_to_insert))
+                            with self.metrics.phase("insert"):
+                                self.write_activities_and_trackpoints(
+                                    activities_to_insert, trackpoints_to_insert, summaries_to_insert,
+                                    files_to_record, loader, executor, writers)
+                            activities_to_insert = []
+                            trackpoints_to_insert = []
+                            summaries_to_insert = []
+                            files_to_record = []
+                            if uncommitted >= commit_size:
+                                with self.metrics.phase("commit"):
+                                    self.db_connection.commit()
+                                uncommitted = 0
+            trackpoint_count += len(trackpoints_to_insert)
+            self.metrics.count("activities", len(activities_to_insert))
+            self.metrics.count("trackpoints", len(trackpoints_to_insert))
+            with self.metrics.phase("insert"):
+                self.write_activities_and_trackpoints(
+                    activities_to_insert, trackpoints_to_insert, summaries_to_insert,
+                    files_to_record, loader, executor, writers)
+            with self.metrics.phase("commit"):
+                self.db_connection.commit()
+        except BaseException:
+            # The uncommitted batch is dropped; everything committed before it is recorded in
+            # IngestedFile, so a resumed load picks up from there.
+            self.db_connection.rollback()
+            raise
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if loader == "load_data":
+                self.enable_load_checks()
+        self.result_cache.bump()
+        elapsed = time.perf_counter() - start
+        self.metrics.count("points_parsed", parsed_count)
+        print("Loaded %d trackpoints with %s and %d writer(s) in %.1f s (%.0f rows/s)"
+              % (trackpoint_count, loader, writers, elapsed, trackpoint_count / elapsed if elapsed else 0))
+        if simplification is not None:
+            print("Simplified with %s: kept %d of %d points (%.1f%%), largest error per activity "
+                  "%.4f km distance and %.1f altitude gain"
+                  % (simplification.describe(), trackpoint_count, parsed_count,
+                     100 * trackpoint_count / parsed_count if parsed_count else 100,
+                     largest_distance_error, largest_altitude_gain_error))
+
+    def label_file_states(self) -> dict[str, tuple[int, float] | None]:
+        states = {}
+        directory = self.data_directory
+        for entry in os.listdir(directory):
+            if os.path.isdir(os.path.join(directory, entry)):
+                filename = os.path.join(directory, entry, "labels.txt")
+                if os.path.exists(filename):
+                    stat = os.stat(filename)
+                    states[entry] = (stat.st_size, stat.st_mtime)
+                else:
+                    states[entry] = None
+        return states
+
+    def save_label_file_states(self, states: dict[str, tuple[int, float] | None]) -> None:
+        query = "REPLACE INTO IngestedLabels (user_id, size, mtime) VALUES (%s, %s, %s)"
+        self.cursor.executemany(query, [(user, *(state or (None, None))) for user, state in states.items()])
+        self.db_connection.commit()
+
+    def delete_activities(self, activity_ids: list[int]) -> None:
+        batch_size = 1000
+        for i in range(0, len(activity_ids), batch_size):
+            batch = activity_ids[i:i + batch_size]
+            placeholders = ", ".join(["%s"] * len(batch))
+            self.cursor.execute("DELETE FROM TrackPoint WHERE activity_id IN (%s)" % placeholders, batch)
+            self.cursor.execute("DELETE FROM ActivitySummary WHERE activity_id IN (%s)" % placeholders, batch)
+            self.cursor.execute("DELETE FROM Activity WHERE id IN (%s)" % placeholders, batch)
+
+    def sync_data(self, processes: int | None = None, simplification: Simplification | None = None) -> None:
+        # Incremental alternative to dropping and reloading everything: only .plt files that are
+        # new, changed or deleted since the last load, and users whose labels changed, are touched.
+        # Leftovers of a crashed load are removed first, which also refuses databases that were
+        # loaded without IngestedFile before anything is deleted.
+        self.remove_unrecorded_activities()
+        self.db_connection.commit()
+        self.result_cache.bump()
+        self.manifest.refresh(self.metrics)
+
+        # Labels are synced before new files are ingested, so those get the current labels.
+        self._label_index = self.new_label_index()
+        self.insert_user_data()
+        self.cursor.execute("SELECT id, has_labels FROM User")
+        has_labels = {row[0]: bool(row[1]) for row in self.cursor.fetchall()}
+        self.cursor.execute("SELECT user_id, size, mtime FROM IngestedLabels")
+        loaded_states = {row[0]: (row[1], row[2]) if row[1] is not None else None
+                         for row in self.cursor.fetchall()}
+        states = self.label_file_states()
+        for user, state in states.items():
+            if state == loaded_states.get(user, False) and self.user_has_labels(user) == has_labels.get(user):
+                continue
+            print("Re-labelling activities of user %s" % user)
+            self.cursor.execute("UPDATE User SET has_labels = %s WHERE id = %s", (self.user_has_labels(user), user))
+            self.cursor.execute("SELECT id, start_date_time, end_date_time FROM Activity WHERE user_id = %s", (user,))
+            labels = []
+            for activity_id, start_time, end_time in self.cursor.fetchall():
+                label = None
+                if self.user_has_labels(user_id=user):
+                    label = self.find_matching_label(user=user, start_end_datetime=(start_time, end_time))
+                labels.append((label, activity_id))
+            self.cursor.executemany("UPDATE Activity SET transportation_mode = %s WHERE id = %s", labels)
             self.db_connection.commit()
+        self.save_label_file_states(states)
+
+        self.cursor.execute("SELECT path, activity_id, size, mtime FROM IngestedFile")
+        loaded = {row[0]: row[1:] for row in self.cursor.fetchall()}
+        new = [path for path in self.manifest.entries if path not in loaded]
+        changed = [path for path, (_, size, mtime) in loaded.items()
+                   if path in self.manifest.entries
+                   and (self.manifest.entries[path]["size"], self.manifest.entries[path]["mtime"]) != (size, mtime)]
+        deleted = [path for path in loaded if path not in self.manifest.entries]
+        print("Sync: %d new, %d changed, %d deleted files" % (len(new), len(changed), len(deleted)))
+
+        # The stale rows are deleted in the same transaction as the reload that replaces them, so
+        # a reload that fails leaves the previous data in place.
+        stale = changed + deleted
+        batch_size = 1000
+        for i in range(0, len(stale), batch_size):
+            batch = stale[i:i + batch_size]
+            self.delete_activities([loaded[path][0] for path in batch if loaded[path][0] is not None])
+            placeholders = ", ".join(["%s"] * len(batch))
+            self.cursor.execute("DELETE FROM IngestedFile WHERE path IN (%s)" % placeholders, batch)
+        self.insert_activity_and_trackpoint_data(processes=processes, resume=True, simplification=simplification)
+
+    def refresh_activity_summary(self, fetch_size: int = 10000) -> None:
+        # Rebuilds ActivitySummary from TrackPoint, for databases loaded before the table existed.
+        # Only the stored points are known here, so simplified activities lose their original counts.
+        self.result_cache.bump()
+        self.cursor.execute("DELETE FROM ActivitySummary")
+        summaries = []
+        activity_rows = []
+        last_activity = None
+        cursor = self.db_connection.cursor()
+        try:
+            cursor.execute("""
+                SELECT activity_id, lat, lon, altitude, date_time
+                FROM TrackPoint
+                ORDER BY activity_id, date_time
+            """)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for activity, *row in rows:
+                    if activity != last_activity and activity_rows:
+                        summaries.append((last_activity, *summarize_activity(activity_rows)[1]))
+                        activity_rows = []
+                    activity_rows.append(row)
+                    last_activity = activity
+            if activity_rows:
+                summaries.append((last_activity, *summarize_activity(activity_rows)[1]))
+        finally:
+            cursor.close()
+        batch_size = 1000
+        for i in range(0, len(summaries), batch_size):
+            self.insert_activity_summaries(summaries[i:i + batch_size])
+        self.db_connection.commit()
+        self.result_cache.bump()
+
+    def export_columnar_cache(self, directory: str = columnar_cache.DEFAULT_DIRECTORY) -> None:
+        # Writes TrackPoint to memory-mappable column files for offline analysis, see columnar_cache.
+        point_count = columnar_cache.export_trackpoints(self.db_connection, directory)
+        print("Exported %d trackpoints to %s" % (point_count, directory))
+
+    def backfill_grid_cells(self) -> None:
+        # Fills TrackPoint.grid_cell for rows loaded before the column existed.
+        self.cursor.execute("UPDATE TrackPoint SET grid_cell = %s WHERE grid_cell IS NULL" % GRID_CELL_SQL)
+        self.db_connection.commit()
+        self.result_cache.bump()
+
+    def users_in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> list[str]:
+        # Users with at least one trackpoint in the half-open box [min_lat, max_lat) x [min_lon, max_lon).
+        clause, params = bbox_predicate(min_lat, min_lon, max_lat, max_lon)
+        query = """
+        SELECT DISTINCT Activity.user_id
+        FROM TrackPoint
+        JOIN Activity ON Activity.id = TrackPoint.activity_id
+        WHERE %s
+        ORDER BY Activity.user_id;
+        """ % clause
+        rows = self.execute_query("users_in_bbox", query, params)
+        return [row[0] for row in rows]
+
+    def activities_in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> list[int]:
+        clause, params = bbox_predicate(min_lat, min_lon, max_lat, max_lon)
+        query = "SELECT DISTINCT TrackPoint.activity_id FROM TrackPoint WHERE %s ORDER BY 1;" % clause
+        rows = self.execute_query("activities_in_bbox", query, params)
+        return [row[0] for row in rows]
+
+    def users_within_radius(self, lat: float, lon: float, radius_km: float) -> list[str]:
+        clause, params = radius_predicate(lat, lon, radius_km)
+        query = """
+        SELECT DISTINCT Activity.user_id
+        FROM TrackPoint
+        JOIN Activity ON Activity.id = TrackPoint.activity_id
+        WHERE %s
+        ORDER BY Activity.user_id;
+        """ % clause
+        rows = self.execute_query("users_within_radius", query, params)
+        return [row[0] for row in rows]
+
+    def execute_query(self, name: str, query: str, params: tuple | list = ()) -> list[tuple]:
+        # Task queries go through here so their execution time (and, with profile_queries,
+        # their EXPLAIN ANALYZE plan) end up in self.metrics.
+        return self.metrics.query(self.cursor, name, query, params)
+
+    def cached_rows(self, name: str, parameters: dict, compute) -> tuple[list[str], list[tuple]]:
+        # compute() returns (headers, rows). The result goes through the same JSON encoding on a
+        # miss as on a hit, so callers see the same types either way.
+        cache_results = self.cache_results and self.result_cache.available()
+        generation = self.result_cache.generation() if cache_results else None
+        if cache_results:
+            result = self.result_cache.get(name, parameters, generation)
+            if result is not None:
+                self.metrics.count("result_cache_hits")
+                return result["headers"], [tuple(row) for row in result["rows"]]
+            self.metrics.count("result_cache_misses")
+        headers, rows = compute()
+        result = json.loads(json.dumps({"headers": list(headers), "rows": rows}, default=encode_value))
+        if cache_results:
+            self.result_cache.put(name, parameters, generation, result)
+        return result["headers"], [tuple(row) for row in result["rows"]]
+
+    def cached_query(self, name: str, query: str, params: tuple | list = ()) -> tuple[list[str], list[tuple]]:
+        def compute():
+            rows = self.execute_query(name, query, params)
+            return self.cursor.column_names, rows
+        return self.cached_rows(name, {"params": list(params)}, compute)
 
     def fetch_data(self, table_name):
         query = "SELECT * FROM %s LIMIT 10"
@@ -233,7 +867,7 @@ class ExampleProgram:
 
     def drop_table(self, table_name) -> None:
         print("Dropping table %s..." % table_name)
-        query = "DROP TABLE %s"
+        query = "DROP TABLE IF EXISTS %s"
         self.cursor.execute(query % table_name)
 
     def show_tables(self) -> None:
@@ -241,18 +875,18 @@ class ExampleProgram:
         rows = self.cursor.fetchall()
         print(tabulate(rows, headers=self.cursor.column_names))
 
-    def task_1(self) -> None:
+    def task_1(self) -> list[tuple]:
         query = """
         SELECT 
             (SELECT COUNT(*) FROM User) AS user_count,
             (SELECT COUNT(*) FROM Activity) AS activity_count,
             (SELECT COUNT(*) FROM TrackPoint) AS trackpoint_count;
         """
-        self.cursor.execute(query)
-        rows = self.cursor.fetchall()
-        print(tabulate(rows, headers=self.cursor.column_names))
+        headers, rows = self.cached_query("task_1", query)
+        print(tabulate(rows, headers=headers), file=self.output)
+        return rows
 
-    def task_2(self) -> None:
+    def task_2(self) -> list[tuple]:
         query = """
         SELECT AVG(activity_count)
         FROM (
@@ -262,11 +896,11 @@ class ExampleProgram:
             GROUP BY User.id
         ) AS user_activity_count;
         """
-        self.cursor.execute(query)
-        rows = self.cursor.fetchall()
-        print(tabulate(rows, headers=self.cursor.column_names))
+        headers, rows = self.cached_query("task_2", query)
+        print(tabulate(rows, headers=headers), file=self.output)
+        return rows
 
-    def task_3(self) -> None:
+    def task_3(self) -> list[tuple]:
         query = """
         SELECT User.id, COUNT(Activity.id) AS activity_count
         FROM User 
@@ -275,213 +909,352 @@ class ExampleProgram:
         ORDER BY activity_count DESC
         LIMIT 20;
         """
-        self.cursor.execute(query)
-        rows = self.cursor.fetchall()
-        print(tabulate(rows, headers=self.cursor.column_names))
+        headers, rows = self.cached_query("task_3", query)
+        print(tabulate(rows, headers=headers), file=self.output)
+        return rows
 
-    def task_4(self) -> None:
+    def task_4(self) -> list[tuple]:
         query = """
         SELECT DISTINCT User.id
         FROM User 
         LEFT JOIN Activity ON User.id = Activity.user_id
         WHERE Activity.transportation_mode= 'taxi';
         """
-        self.cursor.execute(query)
-        rows = self.cursor.fetchall()
-        print(tabulate(rows, headers=self.cursor.column_names))
+        headers, rows = self.cached_query("task_4", query)
+        print(tabulate(rows, headers=headers), file=self.output)
+        return rows
 
-    def task_5(self) -> None:
+    def task_5(self) -> list[tuple]:
         query = """
         SELECT transportation_mode, COUNT(id)
         FROM Activity
         WHERE NOT transportation_mode= 'None'
         GROUP BY transportation_mode;
         """
-        self.cursor.execute(query)
-        rows = self.cursor.fetchall()
-        print(tabulate(rows, headers=self.cursor.column_names))
+        headers, rows = self.cached_query("task_5", query)
+        print(tabulate(rows, headers=headers), file=self.output)
+        return rows
 
-    def task_6a(self) -> None:
-        query = """
-        WITH RECURSIVE year_series AS (
-            SELECT 
-                id,
-                YEAR(start_date_time) AS activity_year,
-                YEAR(end_date_time) AS end_year
-            FROM Activity
-            UNION ALL
-            SELECT
-                id,
-                activity_year + 1,
-                end_year
-            FROM year_series
-            WHERE activity_year < end_year
-        )
-        SELECT
-            activity_year AS year,
-            COUNT(DISTINCT id) AS activity_count
-        FROM year_series
-        GROUP BY activity_year
-        ORDER BY activity_count DESC;
-        """
-        self.cursor.execute(query)
-        rows = self.cursor.fetchall()
-        print(tabulate(rows, headers=self.cursor.column_names))
+    def fill_calendar(self, unit: str) -> None:
+        # Makes sure CalendarBucket has every bucket of the unit between the first and last activity.
+        self.cursor.execute("SELECT MIN(start_date_time), MAX(end_date_time) FROM Activity")
+        first, last = self.cursor.fetchone()
+        if first is None:
+            return
+        query = "INSERT IGNORE INTO CalendarBucket (unit, bucket_start, bucket_end) VALUES (%s, %s, %s)"
+        self.cursor.executemany(query, calendar_buckets.calendar_rows(first, last, unit))
+        self.db_connection.commit()
 
-    def task_6b(self) -> None:
-        total_hours = {}
-        query = """
-        SELECT id, start_date_time, end_date_time
-        FROM Activity
-            """
-        self.cursor.execute(query)
-        rows = self.cursor.fetchall()
+    def activity_buckets(self, unit: str = "year", method: str = "numpy",
+                         fetch_size: int = 10000) -> list[tuple]:
+        # (bucket, activity count, hours) per calendar bucket, see calendar_buckets. "numpy" streams
+        # Activity in fetchmany chunks and splits the intervals on the client, "sql" joins Activity
+        # against the generated CalendarBucket table.
+        if method == "sql":
+            self.fill_calendar(unit)
+            rows = self.execute_query("activity_buckets", calendar_buckets.CALENDAR_BUCKETS_SQL, (unit,))
+            return [(calendar_buckets.bucket_label(start, unit), count, float(hours)) for start, count, hours in rows]
+        buckets = calendar_buckets.CalendarBuckets(unit)
+        cursor = self.db_connection.cursor()
+        try:
+            cursor.execute("SELECT start_date_time, end_date_time FROM Activity")
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                starts, ends = zip(*rows)
+                buckets.add(starts, ends)
+        finally:
+            cursor.close()
+        return buckets.rows()
+
+    def task_6a(self, method: str = "numpy") -> list[tuple]:
+        # Activities per year; an activity spanning several years counts in each of them.
+        headers, rows = self.cached_rows("task_6a", {"method": method}, lambda: (
+            ["year", "activity_count"],
+            sorted(((year, count) for year, count, _ in self.activity_buckets("year", method)),
+                   key=lambda x: x[1], reverse=True)))
+        print(tabulate(rows, headers=headers), file=self.output)
+        return rows
 
-        for row in rows:
-            id = row[0]
-            start_year = row[1].year
-            end_year = row[2].year
+    def task_6b(self, method: str = "numpy") -> list[tuple]:
+        # Hours of activity per year, with activities split at every year boundary they cross.
+        headers, rows = self.cached_rows("task_6b", {"method": method}, lambda: (
+            ["Year", "total hours"],
+            sorted(((year, hours) for year, _, hours in self.activity_buckets("year", method)),
+                   key=lambda x: x[1], reverse=True)))
+        print(tabulate(rows[:20], headers=headers, floatfmt=".4f"), file=self.output)
+        return rows
 
-            if start_year == end_year:
-                hours = (row[2] - row[1]).total_seconds() / 3600
-                total_hours[start_year] = total_hours.get(start_year, 0) + hours
+    def activity_filter(self, user_id: str | None = None, transportation_mode: str | None = None,
+                        start: datetime | None = None, end: datetime | None = None,
+                        activity_ids: list[int] | None = None) -> tuple[str, list]:
+        # WHERE clause over Activity and TrackPoint; the time window [start, end) is on TrackPoint.date_time.
+        conditions = ["TRUE"]
+        params = []
+        if activity_ids is not None:
+            if activity_ids:
+                conditions.append("Activity.id IN (%s)" % ", ".join(["%s"] * len(activity_ids)))
             else:
-                end_of_start_year = datetime(start_year, 12, 31, 23, 59, 59)
-                hours_start_year = (end_of_start_year - row[1]).total_seconds() / 3600
-                total_hours[start_year] = total_hours.get(start_year, 0) + hours_start_year
-
-                start_of_end_year = datetime(end_year, 1, 1, 0, 0, 0)
-                hours_end_year = (row[2] - start_of_end_year).total_seconds() / 3600
-                total_hours[end_year] = total_hours.get(end_year, 0) + hours_end_year
-        sorted_total_hours = sorted(total_hours.items(), key=lambda x: x[1], reverse=True)
-        headers = ["Year", "total hours"]
-        print(tabulate(sorted_total_hours[:20],headers=headers, floatfmt=".4f"))
-
-    def task_7(self) -> None:
+                conditions.append("FALSE")
+            params.extend(activity_ids)
+        if user_id is not None:
+            conditions.append("Activity.user_id = %s")
+            params.append(user_id)
+        if transportation_mode is not None:
+            conditions.append("Activity.transportation_mode = %s")
+            params.append(transportation_mode)
+        if start is not None or end is not None:
+            clause, time_params = range_predicate("TrackPoint.date_time", start, end)
+            conditions.append(clause)
+            params.extend(time_params)
+        return " AND ".join(conditions), params
+
+    def activity_distances(self, user_id: str | None = None, transportation_mode: str | None = None,
+                           start: datetime | None = None, end: datetime | None = None,
+                           activity_ids: list[int] | None = None, fetch_size: int = 100000) -> dict[int, float]:
+        # Kilometres per activity, with a vectorized haversine over each fetched chunk of points.
+        clause, params = self.activity_filter(user_id, transportation_mode, start, end, activity_ids)
         query = """
-        SELECT 
-            TrackPoint.lat, 
-            TrackPoint.lon, 
-            Activity.id, 
-            TrackPoint.date_time, 
-            Activity.transportation_mode
-        FROM User
-        JOIN Activity ON User.id = Activity.user_id
+        SELECT TrackPoint.activity_id, TrackPoint.lat, TrackPoint.lon
+        FROM Activity
         JOIN TrackPoint ON Activity.id = TrackPoint.activity_id
-        WHERE User.id = '112' 
-        AND YEAR(TrackPoint.date_time) = 2008
-        AND Activity.transportation_mode = 'walk'
-        ORDER BY Activity.id DESC, TrackPoint.date_time ASC;
-        """
-        self.cursor.execute(query)
-        rows = self.cursor.fetchall()
-        distances = {}
-        last_activity_id = None
-        last_coordinates = None
+        WHERE %s
+        ORDER BY TrackPoint.activity_id, TrackPoint.date_time;
+        """ % clause
+        cursor = self.db_connection.cursor()
+        try:
+            cursor.execute(query, params)
+            distances = trajectory.ActivityDistances()
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                distances.add(rows)
+        finally:
+            cursor.close()
+        return distances.distances
 
-        for row in rows:
-            lat, lon, activity_id, date_time, transportation_mode = row
-            coordinates = (lat, lon)
+    def distance_per_user(self, transportation_mode: str | None = None,
+                          start: datetime | None = None, end: datetime | None = None) -> dict[str, float]:
+        distances = self.activity_distances(transportation_mode=transportation_mode, start=start, end=end)
+        self.cursor.execute("SELECT id, user_id FROM Activity")
+        return trajectory.group_distances(distances, dict(self.cursor.fetchall()))
 
-            if activity_id not in distances:
-                distances[activity_id] = 0.0
-                last_coordinates = None
+    def distance_per_mode(self, user_id: str | None = None,
+                          start: datetime | None = None, end: datetime | None = None) -> dict[str | None, float]:
+        distances = self.activity_distances(user_id=user_id, start=start, end=end)
+        self.cursor.execute("SELECT id, transportation_mode FROM Activity")
+        return trajectory.group_distances(distances, dict(self.cursor.fetchall()))
 
-            if last_coordinates is not None and last_activity_id == activity_id:
-                distance = haversine(last_coordinates, coordinates)
-                distances[activity_id] += distance
+    def missing_summaries(self) -> int:
+        # Activities without an ActivitySummary row, e.g. in a database loaded before the table
+        # existed and not rebuilt with refresh_activity_summary() since.
+        self.cursor.execute("""
+            SELECT COUNT(*)
+            FROM Activity
+            LEFT JOIN ActivitySummary ON Activity.id = ActivitySummary.activity_id
+            WHERE ActivitySummary.activity_id IS NULL
+        """)
+        return self.cursor.fetchone()[0]
 
-            last_coordinates = coordinates
-            last_activity_id = activity_id
+    def summary_method(self, method: str, fallback: str = "sql") -> str:
+        # "summary" only while every activity has its summary row; otherwise the fallback method,
+        # so reports are never silently missing activities.
+        if method != "summary":
+            return method
+        missing = self.missing_summaries()
+        if missing:
+            self.metrics.count("summary_fallbacks")
+            print("ActivitySummary is missing %d activities, using method=%r instead; "
+                  "refresh_activity_summary() rebuilds it" % (missing, fallback), file=self.output)
+            return fallback
+        return method
 
-        print(f"Total distance walked in 2008 by user 112: {sum(distances.values())} km")
+    def total_distance(self, user_id: str, year: int, transportation_mode: str) -> float:
+        # Activities entirely inside the year are read from ActivitySummary; only the few that
+        # cross a year boundary, or have no summary row, need their points from TrackPoint.
+        start, end = year_range(year)
+        query = """
+        SELECT Activity.id, Activity.start_date_time, Activity.end_date_time, ActivitySummary.distance_km
+        FROM Activity
+        LEFT JOIN ActivitySummary ON Activity.id = ActivitySummary.activity_id
+        WHERE Activity.user_id = %s
+        AND Activity.transportation_mode = %s
+        AND Activity.start_date_time < %s
+        AND Activity.end_date_time >= %s;
+        """
+        rows = self.execute_query("task_7", query, (user_id, transportation_mode, end, start))
+        total_distance = 0.0
+        crossing_activities = []
+        for activity_id, start_date_time, end_date_time, distance in rows:
+            if distance is not None and start_date_time >= start and end_date_time < end:
+                total_distance += distance
+            else:
+                crossing_activities.append(activity_id)
+        if crossing_activities:
+            total_distance += sum(self.activity_distances(start=start, end=end,
+                                                          activity_ids=crossing_activities).values())
+        return total_distance
 
-    def task_8(self) -> None:
+    def task_7(self, user_id: str = "112", year: int = 2008, transportation_mode: str = "walk") -> list[tuple]:
+        parameters = {"user_id": user_id, "year": year, "transportation_mode": transportation_mode}
+        headers, rows = self.cached_rows("task_7", parameters, lambda: (
+            ["total_km"], [(self.total_distance(user_id, year, transportation_mode),)]))
+        print(f"Total distance walked in {year} by user {user_id}: {rows[0][0]} km", file=self.output)
+        return rows
+
+    def altitude_gain_per_user(self, method: str = "sql") -> list[tuple[str, float]]:
+        # Total metres climbed per user, summing the positive altitude deltas between consecutive
+        # valid points of each activity. "summary" adds up ActivitySummary, "sql" pushes the
+        # aggregation into MySQL with LAG(), "stream" does it on the client over an unbuffered
+        # cursor read in fetchmany chunks.
+        method = self.summary_method(method)
+        if method == "stream":
+            return self.altitude_gain_per_user_stream()
+        if method == "summary":
+            query = """
+            SELECT Activity.user_id, SUM(ActivitySummary.altitude_gain) AS altitude_gain
+            FROM Activity
+            JOIN ActivitySummary ON Activity.id = ActivitySummary.activity_id
+            GROUP BY Activity.user_id
+            ORDER BY altitude_gain DESC;
+            """
+            rows = self.execute_query("altitude_gain_per_user", query)
+            return [(user, float(gain)) for user, gain in rows]
         query = """
-        SELECT 
-            User.id, 
-            Activity.id, 
-            TrackPoint.altitude, 
-            TrackPoint.date_time
-        FROM User
-        JOIN Activity ON User.id = Activity.user_id
+        WITH Deltas AS (
+            SELECT
+                Activity.user_id,
+                TrackPoint.altitude - LAG(TrackPoint.altitude) OVER (
+                    PARTITION BY TrackPoint.activity_id ORDER BY TrackPoint.date_time) AS delta
+            FROM Activity
+            JOIN TrackPoint ON Activity.id = TrackPoint.activity_id
+            WHERE NOT TrackPoint.altitude = -777
+        )
+        SELECT user_id, SUM(GREATEST(COALESCE(delta, 0), 0)) AS altitude_gain
+        FROM Deltas
+        GROUP BY user_id
+        ORDER BY altitude_gain DESC;
+        """
+        rows = self.execute_query("altitude_gain_per_user", query)
+        return [(user, float(gain)) for user, gain in rows]
+
+    def altitude_gain_per_user_stream(self, fetch_size: int = 10000) -> list[tuple[str, float]]:
+        query = """
+        SELECT Activity.user_id, TrackPoint.activity_id, TrackPoint.altitude
+        FROM Activity
         JOIN TrackPoint ON Activity.id = TrackPoint.activity_id
         WHERE NOT TrackPoint.altitude = -777
-        ORDER BY 
-            User.id DESC, 
-            Activity.id ASC, 
-            TrackPoint.date_time ASC;
+        ORDER BY TrackPoint.activity_id, TrackPoint.date_time;
         """
-        self.cursor.execute(query)
-        rows = self.cursor.fetchall()
         altitude_gain = {}
-        last_user = None
-        last_altitude = None
         last_activity = None
+        last_altitude = None
+        cursor = self.db_connection.cursor()
+        try:
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for user, activity, altitude in rows:
+                    if user not in altitude_gain:
+                        altitude_gain[user] = 0.0
+                    if activity == last_activity and last_altitude < altitude:
+                        altitude_gain[user] += altitude - last_altitude
+                    last_activity = activity
+                    last_altitude = altitude
+        finally:
+            cursor.close()
+        return sorted(altitude_gain.items(), key=lambda x: x[1], reverse=True)
 
-        for row in rows:
-            user, activity, altitude, _ = row
-
-            if user not in altitude_gain:
-                altitude_gain[user] = 0.0
-                last_altitude = None
-                last_activity = None
-
-            if last_user == user and last_activity != activity:
-                last_altitude = None
-
-            if last_user == user and last_activity == activity:
-                if last_altitude is not None and last_altitude < altitude:
-                    altitude_gain[user] += altitude - last_altitude
-
-            last_altitude = altitude
-            last_user = user
-            last_activity = activity
-
-        sorted_altitude_gain = sorted(
-            altitude_gain.items(), key=lambda x: x[1], reverse=True)
-        headers = ["id", "total meters gained per user"]
-        print(tabulate(sorted_altitude_gain[:20],
-              headers=headers, floatfmt=".4f"))
+    def task_8(self, method: str = "summary") -> list[tuple]:
+        headers, rows = self.cached_rows("task_8", {"method": method}, lambda: (
+            ["id", "total meters gained per user"], self.altitude_gain_per_user(method)))
+        print(tabulate(rows[:20], headers=headers, floatfmt=".4f"), file=self.output)
+        return rows
 
-    def task_9(self) -> None:
-        query = """
-            WITH InvalidActivities AS (
-                SELECT 
-                    Activity.user_id,
-                    Activity.id AS activity_id
-                FROM Activity
-                JOIN TrackPoint T_1 ON Activity.id = T_1.activity_id
-                JOIN TrackPoint T_2 ON Activity.id = T_2.activity_id
-                WHERE T_1.id = T_2.id - 1
-                AND TIMESTAMPDIFF(MINUTE, T_1.date_time, T_2.date_time) >= 5
-                GROUP BY Activity.id, Activity.user_id
-            )
-            SELECT 
-                InvalidActivities.user_id,
-                COUNT(InvalidActivities.activity_id) AS invalid_activity_count
-            FROM InvalidActivities
-            GROUP BY InvalidActivities.user_id
-            ORDER BY InvalidActivities.user_id DESC;
+    def gapped_activities(self, threshold_minutes: int = 5, method: str = "sql") -> list[tuple[str, int]]:
+        # (user_id, number of activities) for activities with two consecutive trackpoints, ordered by
+        # date_time, at least threshold_minutes apart. "summary" reads ActivitySummary.max_gap_seconds,
+        # "sql" uses LAG() over the (activity_id, date_time) index, "stream" scans TrackPoint once
+        # in that order on the client.
+        method = self.summary_method(method)
+        if method == "stream":
+            return self.gapped_activities_stream(threshold_minutes)
+        if method == "summary":
+            query = """
+            SELECT Activity.user_id, COUNT(*) AS invalid_activity_count
+            FROM Activity
+            JOIN ActivitySummary ON Activity.id = ActivitySummary.activity_id
+            WHERE ActivitySummary.max_gap_seconds >= %s
+            GROUP BY Activity.user_id
+            ORDER BY Activity.user_id DESC;
             """
-        self.cursor.execute(query)
-        rows = self.cursor.fetchall()
-        print(tabulate(rows, headers=self.cursor.column_names))
-
-    def task_10(self) -> None:
+            return self.execute_query("gapped_activities", query, (threshold_minutes * 60,))
         query = """
-        SELECT DISTINCT User.id
-        FROM User
-        JOIN Activity ON User.id = Activity.user_id
-        JOIN TrackPoint ON Activity.id = TrackPoint.activity_id
-        WHERE TrackPoint.lat LIKE '39.916%' 
-        AND TrackPoint.lon LIKE '116.397%';
+        WITH Gaps AS (
+            SELECT
+                activity_id,
+                TIMESTAMPDIFF(MINUTE, LAG(date_time) OVER (PARTITION BY activity_id ORDER BY date_time),
+                              date_time) AS gap_minutes
+            FROM TrackPoint
+        )
+        SELECT
+            Activity.user_id,
+            COUNT(DISTINCT Gaps.activity_id) AS invalid_activity_count
+        FROM Gaps
+        JOIN Activity ON Activity.id = Gaps.activity_id
+        WHERE Gaps.gap_minutes >= %s
+        GROUP BY Activity.user_id
+        ORDER BY Activity.user_id DESC;
         """
-        self.cursor.execute(query)
-        rows = self.cursor.fetchall()
-        print(tabulate(rows, headers=self.cursor.column_names, floatfmt=".6f"))
+        return self.execute_query("gapped_activities", query, (threshold_minutes,))
+
+    def gapped_activities_stream(self, threshold_minutes: int = 5, fetch_size: int = 10000) -> list[tuple[str, int]]:
+        self.cursor.execute("SELECT id, user_id FROM Activity")
+        activity_users = dict(self.cursor.fetchall())
+        threshold = threshold_minutes * 60
+        invalid_activities = set()
+        last_activity = None
+        last_date_time = None
+        # The default cursor is unbuffered, so rows are pulled from the server fetch_size at a time.
+        cursor = self.db_connection.cursor()
+        try:
+            cursor.execute("SELECT activity_id, date_time FROM TrackPoint ORDER BY activity_id, date_time")
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for activity, date_time in rows:
+                    if activity == last_activity and (date_time - last_date_time).total_seconds() >= threshold:
+                        invalid_activities.add(activity)
+                    last_activity = activity
+                    last_date_time = date_time
+        finally:
+            cursor.close()
+        invalid_activity_count = {}
+        for activity in invalid_activities:
+            user = activity_users[activity]
+            invalid_activity_count[user] = invalid_activity_count.get(user, 0) + 1
+        return sorted(invalid_activity_count.items(), reverse=True)
+
+    def task_9(self, threshold_minutes: int = 5, method: str = "summary") -> list[tuple]:
+        headers, rows = self.cached_rows(
+            "task_9", {"threshold_minutes": threshold_minutes, "method": method},
+            lambda: (["user_id", "invalid_activity_count"], self.gapped_activities(threshold_minutes, method)))
+        print(tabulate(rows, headers=headers), file=self.output)
+        return rows
 
-    def task_11(self) -> None:
+    def task_10(self) -> list[tuple]:
+        # Same users as lat LIKE '39.916%' AND lon LIKE '116.397%', as an indexed grid range query
+        headers, rows = self.cached_rows("task_10", {}, lambda: (
+            ["id"], [(user,) for user in self.users_in_bbox(39.916, 116.397, 39.917, 116.398)]))
+        print(tabulate(rows, headers=headers, floatfmt=".6f"), file=self.output)
+        return rows
+
+    def task_11(self) -> list[tuple]:
         query = """
         WITH TransportationCount AS (
             SELECT 
@@ -508,29 +1281,73 @@ class ExampleProgram:
         WHERE mode_rank = 1
         ORDER BY id ASC;
         """
-        self.cursor.execute(query)
-        rows = self.cursor.fetchall()
-        print(tabulate(rows, headers=self.cursor.column_names))
+        headers, rows = self.cached_query("task_11", query)
+        print(tabulate(rows, headers=headers), file=self.output)
+        return rows
 
 
-def main():
+def main(resume: bool = False, sync: bool = False, metrics_file: str | None = None,
+         partition_by_year: bool = False, backend: str = "mysql", simplification: Simplification | None = None):
     program = None
     try:
-        program = ExampleProgram()
-        program.drop_table("TrackPoint")
-        program.drop_table("Activity")
-        program.drop_table("User")
-        program.create_tables()
+        program = ExampleProgram(backend=backend)
+        if sync:
+            program.create_tables()
+            program.sync_data(simplification=simplification)
+            return
+        if not resume:
+            program.drop_table("CalendarBucket")
+            program.drop_table("TaskResult")
+            program.drop_table("DataGeneration")
+            program.drop_table("IngestedLabels")
+            program.drop_table("IngestedFile")
+            program.drop_table("ActivitySummary")
+            program.drop_table("TrackPoint")
+            program.drop_table("Activity")
+            program.drop_table("User")
+        program.create_tables(partition_by_year=partition_by_year)
         program.insert_user_data()
-        program.insert_activity_data()
-        program.insert_trackpoint_data()
+        label_states = program.label_file_states()
+        program.insert_activity_and_trackpoint_data(resume=resume, simplification=simplification)
+        program.save_label_file_states(label_states)
 
     except Exception as e:
         print("ERROR: Failed to use database:", e)
     finally:
         if program:
+            if metrics_file:
+                program.metrics.export(metrics_file)
             program.connection.close_connection()
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Load the Geolife dataset into MySQL")
+    parser.add_argument("--resume", action="store_true", help="continue a crashed load instead of reloading")
+    parser.add_argument("--sync", action="store_true", help="only load new, changed and deleted files")
+    parser.add_argument("--metrics", default=None, help="write phase timings and counters as JSON to this file")
+    parser.add_argument("--partition-by-year", action="store_true",
+                        help="create TrackPoint with one partition per year (no foreign key to Activity)")
+    parser.add_argument("--backend", choices=["mysql", "sqlite", "duckdb"], default="mysql",
+                        help="sqlite and duckdb load into a local database file instead of the MySQL server")
+    parser.add_argument("--simplify", choices=["dedupe", "douglas_peucker", "tolerance"], default=None,
+                        help="thin each activity's points before they are written to TrackPoint")
+    parser.add_argument("--tolerance", type=float, default=5.0, help="simplification tolerance in metres")
+    parser.add_argument("--max-interval", type=int, default=60,
+                        help="never leave more than this many seconds between kept points")
+    parser.add_argument("--altitude-tolerance", type=float, default=5.0,
+                        help="simplification tolerance in altitude units (feet in Geolife)")
+    parser.add_argument("--max-distance-error", type=float, default=None,
+                        help="keep every point of an activity whose simplified distance is off by more than "
+                             "this fraction of its distance (default: no limit)")
+    parser.add_argument("--max-altitude-gain-error", type=float, default=None,
+                        help="keep every point of an activity whose simplified altitude gain is off by more than "
+                             "this fraction of its gain (default: no limit)")
+    args = parser.parse_args()
+    simplification = None
+    if args.simplify:
+        simplification = Simplification(METHOD=args.simplify, TOLERANCE_M=args.tolerance,
+                                        MAX_INTERVAL_S=args.max_interval, ALTITUDE_TOLERANCE=args.altitude_tolerance,
+                                        MAX_DISTANCE_ERROR=args.max_distance_error,
+                                        MAX_ALTITUDE_GAIN_ERROR=args.max_altitude_gain_error)
+    main(resume=args.resume, sync=args.sync, metrics_file=args.metrics, partition_by_year=args.partition_by_year,
+         backend=args.backend, simplification=simplification)
@@ -0,0 +1,93 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta
+import os
+
+from plt_parser import parse_label_timestamp
+
+
+class LabelIndex:
+    """
+    Loads the labels of every labelled user once and keeps them in memory.
+    Each user's labels.txt is read lazily, the first time that user is looked up,
+    into a (start, end) -> transportation mode map for exact O(1) matching and a
+    list sorted by start time for overlap and near-match lookups.
+
+    Example:
+    index = LabelIndex()
+    index.match("010", start_time, end_time) // "taxi" or None
+    index.nearest("010", start_time, end_time, timedelta(seconds=30))
+    """
+
+    def __init__(self,
+                 DATA_DIRECTORY="dataset/dataset/Data",
+                 LABELED_IDS_FILE="dataset/dataset/labeled_ids.txt"):
+        self.data_directory = DATA_DIRECTORY
+        with open(LABELED_IDS_FILE, "r") as file:
+            self.users_with_labels: set[str] = {line.strip() for line in file if line.strip()}
+        self.exact_labels: dict[str, dict[tuple[datetime, datetime], str]] = {}
+        self.sorted_labels: dict[str, list[tuple[datetime, datetime, str]]] = {}
+        self.sorted_starts: dict[str, list[datetime]] = {}
+        # Running maximum of the end times, so overlap scans can stop early.
+        self.max_ends: dict[str, list[datetime]] = {}
+
+    def has_labels(self, user_id: str) -> bool:
+        return user_id in self.users_with_labels
+
+    def load_user(self, user_id: str) -> None:
+        exact = {}
+        labels = []
+        filename = os.path.join(self.data_directory, user_id, "labels.txt")
+        if self.has_labels(user_id) and os.path.exists(filename):
+            with open(filename, 'r') as file:
+                next(file, None)  # Skip header
+                for line in file:
+                    column = line.strip().split('\t')
+                    if len(column) < 3:
+                        continue
+                    start_time = parse_label_timestamp(column[0])
+                    end_time = parse_label_timestamp(column[1])
+                    # Keep the first label when the same interval is listed twice
+                    exact.setdefault((start_time, end_time), column[2])
+                    labels.append((start_time, end_time, column[2]))
+        labels.sort()
+        max_ends = []
+        for _, end_time, _ in labels:
+            max_ends.append(end_time if not max_ends or end_time > max_ends[-1] else max_ends[-1])
+        self.exact_labels[user_id] = exact
+        self.sorted_labels[user_id] = labels
+        self.sorted_starts[user_id] = [label[0] for label in labels]
+        self.max_ends[user_id] = max_ends
+
+    def match(self, user_id: str, start_time: datetime, end_time: datetime) -> str | None:
+        if user_id not in self.exact_labels:
+            self.load_user(user_id)
+        return self.exact_labels[user_id].get((start_time, end_time))
+
+    def overlapping(self, user_id: str, start_time: datetime, end_time: datetime) -> list[tuple[datetime, datetime, str]]:
+        if user_id not in self.exact_labels:
+            self.load_user(user_id)
+        labels = self.sorted_labels[user_id]
+        max_ends = self.max_ends[user_id]
+        result = []
+        i = bisect_right(self.sorted_starts[user_id], end_time) - 1
+        while i >= 0 and max_ends[i] >= start_time:
+            if labels[i][1] >= start_time:
+                result.append(labels[i])
+            i -= 1
+        result.reverse()
+        return result
+
+    def nearest(self, user_id: str, start_time: datetime, end_time: datetime,
+                tolerance: timedelta) -> str | None:
+        # The label whose start and end are both within tolerance of the activity's,
+        # preferring the smallest total difference.
+        best = None
+        best_difference = None
+        for label_start, label_end, mode in self.overlapping(user_id, start_time - tolerance, end_time + tolerance):
+            start_difference = abs(label_start - start_time)
+            end_difference = abs(label_end - end_time)
+            if start_difference <= tolerance and end_difference <= tolerance:
+                if best_difference is None or start_difference + end_difference < best_difference:
+                    best = mode
+                    best_difference = start_difference + end_difference
+        return best
@@ -0,0 +1,94 @@
+from contextlib import contextmanager
+import json
+import time
+
+
+class Metrics:
+    """
+    Collects structured timings and counters for ingest and queries instead of per-file prints.
+    Phases accumulate wall-clock seconds and call counts, counters accumulate numbers (files,
+    rows, bytes), progress lines are throttled to one every PROGRESS_INTERVAL seconds, and
+    query() optionally records EXPLAIN ANALYZE output next to each query's execution time.
+
+    Example:
+    metrics = Metrics(PROFILE_QUERIES=True)
+    with metrics.phase("insert"):
+        ...
+    metrics.count("trackpoints", len(rows))
+    metrics.export("metrics.json")
+    """
+
+    def __init__(self, PROGRESS_INTERVAL=2.0, PROFILE_QUERIES=False):
+        self.progress_interval = PROGRESS_INTERVAL
+        self.profile_queries = PROFILE_QUERIES
+        self.phases: dict[str, dict[str, float]] = {}
+        self.counters: dict[str, int] = {}
+        self.queries: list[dict] = []
+        self.last_progress: dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        phase = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0})
+        phase["seconds"] += seconds
+        phase["calls"] += 1
+
+    def timed_iter(self, name: str, iterable):
+        # Yields from iterable, charging the time spent waiting for each item to the phase.
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def progress(self, name: str, done: int, total: int | None = None) -> None:
+        now = time.perf_counter()
+        if done != total and now - self.last_progress.get(name, 0.0) < self.progress_interval:
+            return
+        self.last_progress[name] = now
+        elapsed = now - self.started
+        if total:
+            print("%s: %d/%d (%.0f%%, %.1f s)" % (name, done, total, 100 * done / total, elapsed))
+        else:
+            print("%s: %d (%.1f s)" % (name, done, elapsed))
+
+    def query(self, cursor, name: str, query: str, params: tuple | list = ()) -> list[tuple]:
+        # Executes and fetches the query, recording its time and row count. The plan is captured
+        # first, so the cursor's column names still belong to the real query afterwards.
+        record = {"name": name}
+        if self.profile_queries:
+            cursor.execute("EXPLAIN ANALYZE " + query.strip().rstrip(";"), params)
+            # The plan text is the last column: MySQL returns only that one, DuckDB and SQLite more.
+            record["explain_analyze"] = "\n".join(str(row[-1]) for row in cursor.fetchall())
+        start = time.perf_counter()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        record["seconds"] = time.perf_counter() - start
+        record["rows"] = len(rows)
+        self.queries.append(record)
+        return rows
+
+    def to_dict(self) -> dict:
+        return {
+            "elapsed_seconds": time.perf_counter() - self.started,
+            "phases": self.phases,
+            "counters": self.counters,
+            "queries": self.queries,
+        }
+
+    def export(self, filename: str) -> None:
+        with open(filename, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
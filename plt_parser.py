@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+
+from spatial import grid_cell
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# A .plt file has 6 header lines followed by lines of the form
+# lat,lon,0,altitude,days_since_1899-12-30,YYYY-MM-DD,HH:MM:SS
+HEADER_LINES = 6
+MAX_LINES = 2506
+PLT_EPOCH = datetime(1899, 12, 30)
+# Days between the .plt day count epoch (1899-12-30) and the Unix epoch (1970-01-01).
+PLT_EPOCH_UNIX_OFFSET_DAYS = 25569
+
+
+def parse_timestamp(date: str, time: str) -> datetime:
+    # The layout is fixed (YYYY-MM-DD and HH:MM:SS), which fromisoformat decodes in C,
+    # roughly 25 times faster than strptime with a format string.
+    return datetime.fromisoformat(f"{date} {time}")
+
+
+def parse_label_timestamp(value: str) -> datetime:
+    # labels.txt uses YYYY/MM/DD HH:MM:SS.
+    return datetime.fromisoformat(value.replace('/', '-'))
+
+
+def days_to_datetime(days: float) -> datetime:
+    # Field 4 of a .plt line is the fractional day count since 1899-12-30.
+    return PLT_EPOCH + timedelta(seconds=round(days * 86400))
+
+
+def read_first_last_datetime(filename: str) -> tuple[datetime | None, datetime | None]:
+    first_datetime = None
+    last_datetime = None
+    with open(filename, 'r') as file:
+        for line_number, line in enumerate(file):
+            if line_number < HEADER_LINES:
+                continue
+            fields = line.strip().split(",")
+            if len(fields) < 7:
+                continue
+            if first_datetime is None:
+                first_datetime = parse_timestamp(fields[-2], fields[-1])
+            last_fields = fields
+    if first_datetime is not None:
+        last_datetime = parse_timestamp(last_fields[-2], last_fields[-1])
+    return first_datetime, last_datetime
+
+
+def scan_plt_file(full_path: str) -> tuple[int, bool, datetime | None, datetime | None]:
+    # Validates a file without building rows: returns the line count (stopping once it passes
+    # MAX_LINES), the validity verdict and the first and last timestamp.
+    line_count = 0
+    first_fields = None
+    last_fields = None
+    with open(full_path, 'r') as file:
+        for line in file:
+            line_count += 1
+            if line_count > MAX_LINES:
+                return line_count, False, None, None
+            if line_count <= HEADER_LINES:
+                continue
+            fields = line.strip().split(",")
+            if len(fields) < 7:
+                continue
+            if first_fields is None:
+                first_fields = fields
+            last_fields = fields
+    if line_count <= HEADER_LINES or first_fields is None:
+        return line_count, False, None, None
+    return (line_count, True, parse_timestamp(first_fields[5], first_fields[6]),
+            parse_timestamp(last_fields[5], last_fields[6]))
+
+
+def parse_plt_file(full_path: str) -> tuple[str, bool, datetime | None, datetime | None, list[tuple]]:
+    # Reads a .plt file exactly once and returns the validity verdict, the first and last
+    # timestamp and the parsed (lat, lon, altitude, date_time, grid_cell) rows together. Runs in worker processes.
+    rows = []
+    line_count = 0
+    with open(full_path, 'r') as file:
+        for line in file:
+            line_count += 1
+            if line_count > MAX_LINES:
+                return full_path, False, None, None, []
+            if line_count <= HEADER_LINES:
+                continue
+            fields = line.strip().split(",")
+            if len(fields) < 7:
+                continue
+            rows.append((fields[0], fields[1], fields[3], parse_timestamp(fields[5], fields[6]),
+                         grid_cell(float(fields[0]), float(fields[1]))))
+    if line_count <= HEADER_LINES or not rows:
+        return full_path, False, None, None, []
+    return full_path, True, rows[0][3], rows[-1][3], rows
+
+
+def read_plt_columns(full_path: str) -> dict:
+    # Columnar NumPy path: the whole file is decoded in one call into lat, lon, altitude and
+    # epoch seconds arrays. The timestamp comes from the day count, so no strings are parsed.
+    if np is None:
+        raise ImportError("read_plt_columns requires numpy")
+    data = np.loadtxt(full_path, delimiter=',', skiprows=HEADER_LINES, usecols=(0, 1, 3, 4), ndmin=2)
+    epoch_seconds = np.rint((data[:, 3] - PLT_EPOCH_UNIX_OFFSET_DAYS) * 86400).astype(np.int64)
+    return {
+        "lat": data[:, 0],
+        "lon": data[:, 1],
+        "altitude": data[:, 2],
+        "epoch_seconds": epoch_seconds,
+    }
@@ -0,0 +1,103 @@
+from datetime import date, datetime
+from decimal import Decimal
+import hashlib
+import json
+
+
+def encode_value(value):
+    # json.dumps fallback for the column types MySQL hands back.
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+class ResultCache:
+    """
+    Stores task reports in the TaskResult side table, keyed by task name, parameters and the
+    data generation they were computed at. DataGeneration holds a single counter that every
+    ingest bumps, so a cached result is only returned while the data it was built from is unchanged.
+    Both tables are created by ExampleProgram.create_tables(); on a database created before
+    them, available() is False and the cache is simply off.
+
+    Example:
+    cache = ResultCache(db_connection)
+    generation = cache.generation()
+    cache.get("task_3", {}, generation) // None until put() stored a result for this generation
+    cache.bump() // after loading data: every stored result is now stale
+    """
+
+    def __init__(self, DB_CONNECTION):
+        self.db_connection = DB_CONNECTION
+        self._available = False
+
+    def available(self) -> bool:
+        # Only a positive answer is remembered, so the cache turns on once create_tables() has run.
+        if not self._available:
+            cursor = self.db_connection.cursor()
+            try:
+                cursor.execute("SHOW TABLES")
+                tables = {row[0].lower() for row in cursor.fetchall()}
+            finally:
+                cursor.close()
+            self._available = {"datageneration", "taskresult"} <= tables
+        return self._available
+
+    def generation(self) -> int:
+        cursor = self.db_connection.cursor()
+        try:
+            cursor.execute("SELECT generation FROM DataGeneration WHERE id = 1")
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+        return row[0] if row else 0
+
+    def bump(self, commit: bool = True) -> None:
+        # Commits on the shared connection, so it is called after (or before) a write, never halfway.
+        # With commit=False the new generation becomes visible with the caller's next commit.
+        if not self.available():
+            return
+        cursor = self.db_connection.cursor()
+        try:
+            cursor.execute("UPDATE DataGeneration SET generation = generation + 1 WHERE id = 1")
+        finally:
+            cursor.close()
+        if commit:
+            self.db_connection.commit()
+
+    @staticmethod
+    def key(task_name: str, parameters: dict) -> tuple[str, str]:
+        parameters_json = json.dumps(parameters, sort_keys=True, default=encode_value)
+        return parameters_json, hashlib.sha1(parameters_json.encode()).hexdigest()
+
+    def get(self, task_name: str, parameters: dict, generation: int):
+        _, parameters_hash = self.key(task_name, parameters)
+        cursor = self.db_connection.cursor()
+        try:
+            cursor.execute("SELECT result FROM TaskResult WHERE task_name = %s AND parameters_hash = %s "
+                           "AND generation = %s", (task_name, parameters_hash, generation))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+        return json.loads(row[0]) if row else None
+
+    def put(self, task_name: str, parameters: dict, generation: int, result) -> None:
+        parameters_json, parameters_hash = self.key(task_name, parameters)
+        cursor = self.db_connection.cursor()
+        try:
+            cursor.execute("REPLACE INTO TaskResult (task_name, parameters_hash, parameters, generation, result) "
+                           "VALUES (%s, %s, %s, %s, %s)",
+                           (task_name, parameters_hash, parameters_json, generation,
+                            json.dumps(result, default=encode_value)))
+        finally:
+            cursor.close()
+        self.db_connection.commit()
+
+    def clear(self) -> None:
+        cursor = self.db_connection.cursor()
+        try:
+            cursor.execute("DELETE FROM TaskResult")
+        finally:
+            cursor.close()
+        self.db_connection.commit()
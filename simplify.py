@@ -0,0 +1,199 @@
+import numpy as np
+
+import trajectory
+
+# Optional thinning of an activity's points before they are written to TrackPoint. Rows are the
+# (lat, lon, altitude, date_time, ...) tuples of plt_parser.parse_plt_file, in time order.
+METHODS = ("dedupe", "douglas_peucker", "tolerance")
+METRES_PER_DEGREE = trajectory.EARTH_RADIUS_KM * 1000 * np.pi / 180
+INVALID_ALTITUDE = -777
+
+
+def drop_duplicate_timestamps(rows: list[tuple]) -> list[tuple]:
+    # Keeps the first point of every timestamp, whether its repeats follow it directly or come
+    # later in the file.
+    seen = set()
+    kept = []
+    for row in rows:
+        if row[3] not in seen:
+            seen.add(row[3])
+            kept.append(row)
+    return kept
+
+
+def local_metres(rows: list[tuple]) -> tuple[np.ndarray, np.ndarray]:
+    # Equirectangular projection around the first point; plenty for the few km of one activity.
+    lat = np.array([float(row[0]) for row in rows])
+    lon = np.array([float(row[1]) for row in rows])
+    x = (lon - lon[0]) * METRES_PER_DEGREE * np.cos(np.radians(lat[0]))
+    y = (lat - lat[0]) * METRES_PER_DEGREE
+    return x, y
+
+
+def altitudes_and_seconds(rows: list[tuple]) -> tuple[np.ndarray, np.ndarray]:
+    # Altitude with NaN for the -777 "no altitude" marker, and seconds since the first point.
+    z = np.array([float(row[2]) for row in rows])
+    z[z == INVALID_ALTITUDE] = np.nan
+    seconds = np.array([(row[3] - rows[0][3]).total_seconds() for row in rows])
+    return z, seconds
+
+
+def altitude_deviation(z: np.ndarray, seconds: np.ndarray, first: int, last: int) -> np.ndarray:
+    # Distance of the altitudes between first and last from the straight line between their
+    # altitudes, interpolated by time. Points without an altitude never need keeping for it; if
+    # one end has none, the other end's altitude is used for both.
+    z_first = z[first] if not np.isnan(z[first]) else z[last]
+    z_last = z[last] if not np.isnan(z[last]) else z[first]
+    inner = z[first + 1:last]
+    if np.isnan(z_first):
+        return np.zeros(len(inner))
+    fraction = (seconds[first + 1:last] - seconds[first]) / (seconds[last] - seconds[first])
+    return np.nan_to_num(np.abs(inner - (z_first + fraction * (z_last - z_first))))
+
+
+def douglas_peucker_mask(x: np.ndarray, y: np.ndarray, tolerance: float, z: np.ndarray | None = None,
+                         seconds: np.ndarray | None = None, altitude_tolerance: float | None = None) -> np.ndarray:
+    # Iterative Douglas-Peucker: every dropped point lies within tolerance of the kept polyline,
+    # and, with an altitude_tolerance, within that of the kept altitude profile too.
+    keep = np.zeros(len(x), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(x) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        length_squared = dx * dx + dy * dy
+        if length_squared == 0:
+            distances = np.hypot(px, py)
+        else:
+            # Distance to the segment, not the infinite line, so back-tracking points are kept.
+            t = np.clip((px * dx + py * dy) / length_squared, 0, 1)
+            distances = np.hypot(px - t * dx, py - t * dy)
+        # Deviation in multiples of the tolerance, so one split serves both tests.
+        deviation = distances / tolerance
+        if altitude_tolerance is not None:
+            deviation = np.maximum(deviation, altitude_deviation(z, seconds, first, last) / altitude_tolerance)
+        farthest = int(np.argmax(deviation))
+        if deviation[farthest] > 1:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+
+def tolerance_mask(x: np.ndarray, y: np.ndarray, tolerance: float, z: np.ndarray | None = None,
+                   altitude_tolerance: float | None = None) -> np.ndarray:
+    # Keeps a point once it is at least tolerance metres from the last kept point or, with an
+    # altitude_tolerance, once its altitude differs by that much from the last kept altitude.
+    keep = np.zeros(len(x), dtype=bool)
+    keep[0] = keep[-1] = True
+    last = 0
+    last_altitude = z[0] if z is not None else np.nan
+    for i in range(1, len(x) - 1):
+        climbed = (altitude_tolerance is not None and not np.isnan(z[i])
+                   and (np.isnan(last_altitude) or abs(z[i] - last_altitude) >= altitude_tolerance))
+        if climbed or np.hypot(x[i] - x[last], y[i] - y[last]) >= tolerance:
+            keep[i] = True
+            last = i
+            if z is not None and not np.isnan(z[i]):
+                last_altitude = z[i]
+    return keep
+
+
+def keep_time_gaps(rows: list[tuple], keep: np.ndarray, max_interval_seconds: int) -> np.ndarray:
+    # Re-adds points so kept neighbours are never more than max_interval_seconds apart, unless they
+    # already were in the original. Time-gap analyses (task_9) then see the same gaps as before.
+    last_kept = rows[0][3]
+    for i in range(1, len(rows)):
+        if keep[i]:
+            last_kept = rows[i][3]
+        elif (rows[i + 1][3] - last_kept).total_seconds() > max_interval_seconds:
+            keep[i] = True
+            last_kept = rows[i][3]
+    return keep
+
+
+class Simplification:
+    """
+    Opt-in ingest stage that thins an activity's points. Exact duplicate timestamps are always
+    dropped; METHOD "douglas_peucker" then removes points within TOLERANCE_M metres of the
+    simplified line and ALTITUDE_TOLERANCE of the simplified altitude profile, and "tolerance"
+    keeps a point only once it is TOLERANCE_M metres or ALTITUDE_TOLERANCE in altitude from the
+    last kept one. Either way no two kept points are more than MAX_INTERVAL_S seconds apart
+    unless they already were. ALTITUDE_TOLERANCE is in the units of the altitude column; None
+    leaves altitude out of the test.
+
+    apply() measures the distance and altitude gain the kept points lose. Much of that is GPS
+    jitter, which inflates both sums of the raw points, so there is no limit by default. With
+    MAX_DISTANCE_ERROR or MAX_ALTITUDE_GAIN_ERROR, a fraction of the activity's own distance or
+    gain, an activity that would lose more keeps every point except its duplicate timestamps.
+    That bounds what reports computed from TrackPoint lose per activity to the limits plus
+    whatever the duplicates alone account for.
+
+    Example:
+    simplification = Simplification(METHOD="douglas_peucker", TOLERANCE_M=5, MAX_ALTITUDE_GAIN_ERROR=0.2)
+    kept_rows = simplification.simplify(rows)
+    program.insert_activity_and_trackpoint_data(simplification=simplification)
+    """
+
+    def __init__(self, METHOD="douglas_peucker", TOLERANCE_M=5.0, MAX_INTERVAL_S=60, ALTITUDE_TOLERANCE=5.0,
+                 MAX_DISTANCE_ERROR=None, MAX_ALTITUDE_GAIN_ERROR=None):
+        if METHOD not in METHODS:
+            raise ValueError("Unknown simplification %r, expected one of %s" % (METHOD, ", ".join(METHODS)))
+        if TOLERANCE_M <= 0 or (ALTITUDE_TOLERANCE is not None and ALTITUDE_TOLERANCE <= 0):
+            raise ValueError("Simplification tolerances must be positive")
+        self.method = METHOD
+        self.tolerance_m = TOLERANCE_M
+        self.max_interval_s = MAX_INTERVAL_S
+        self.altitude_tolerance = ALTITUDE_TOLERANCE
+        self.max_distance_error = MAX_DISTANCE_ERROR
+        self.max_altitude_gain_error = MAX_ALTITUDE_GAIN_ERROR
+
+    def simplify(self, rows: list[tuple]) -> list[tuple]:
+        rows = drop_duplicate_timestamps(rows)
+        if self.method == "dedupe" or len(rows) < 3:
+            return rows
+        x, y = local_metres(rows)
+        z, seconds = altitudes_and_seconds(rows)
+        if self.method == "douglas_peucker":
+            keep = douglas_peucker_mask(x, y, self.tolerance_m, z, seconds, self.altitude_tolerance)
+        else:
+            keep = tolerance_mask(x, y, self.tolerance_m, z, self.altitude_tolerance)
+        if self.max_interval_s is not None:
+            keep = keep_time_gaps(rows, keep, self.max_interval_s)
+        return [row for row, kept in zip(rows, keep) if kept]
+
+    def apply(self, rows: list[tuple]) -> tuple[list[tuple], tuple]:
+        # The kept rows and the ActivitySummary figures of the activity. Distance, altitude gain,
+        # gaps and bounding box come from all points, so reports on ActivitySummary stay exact;
+        # point_count is the number of kept points, followed by the original count and the
+        # distance (km) and altitude gain lost by the kept points alone.
+        # An activity over a limit falls back to its points minus the duplicate timestamps.
+        summary = trajectory.summarize_rows(rows)
+        kept = self.simplify(rows)
+        distance_error, altitude_gain_error = self.errors(summary, kept)
+        if self.exceeds_limits(summary, distance_error, altitude_gain_error):
+            kept = drop_duplicate_timestamps(rows)
+            distance_error, altitude_gain_error = self.errors(summary, kept)
+        return kept, (len(kept), *summary[1:], len(rows), distance_error, altitude_gain_error)
+
+    @staticmethod
+    def errors(summary: tuple, kept: list[tuple]) -> tuple[float, float]:
+        kept_summary = trajectory.summarize_rows(kept)
+        return summary[1] - kept_summary[1], summary[2] - kept_summary[2]
+
+    def describe(self) -> str:
+        if self.method == "dedupe":
+            return self.method
+        if self.altitude_tolerance is None:
+            return "%s (%.1f m)" % (self.method, self.tolerance_m)
+        return "%s (%.1f m, %.1f altitude)" % (self.method, self.tolerance_m, self.altitude_tolerance)
+
+    def exceeds_limits(self, summary: tuple, distance_error: float, altitude_gain_error: float) -> bool:
+        # The limits are fractions of the activity's distance and altitude gain from all points.
+        return ((self.max_distance_error is not None and abs(distance_error) > self.max_distance_error * summary[1])
+                or (self.max_altitude_gain_error is not None
+                    and abs(altitude_gain_error) > self.max_altitude_gain_error * summary[2]))
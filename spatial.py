@@ -0,0 +1,60 @@
+from math import asin, cos, degrees, floor, radians, sin
+
+# TrackPoints are bucketed into a fixed grid of 0.001 x 0.001 degree cells (about 110 x 85 m
+# in Beijing). The cell id is stored in TrackPoint.grid_cell next to an index, so bounding box
+# lookups become index range scans instead of full scans over lat and lon.
+CELLS_PER_DEGREE = 1000
+LON_CELLS = 360 * CELLS_PER_DEGREE + 1
+EARTH_RADIUS_KM = 6371.0088
+# Above this many grid rows a box is searched with one cell range instead of one per row.
+MAX_CELL_RANGES = 200
+
+# The same formula in SQL, used to fill grid_cell for rows loaded without it.
+GRID_CELL_SQL = ("(FLOOR(lat * %d) + %d) * %d + FLOOR(lon * %d) + %d"
+                 % (CELLS_PER_DEGREE, 90 * CELLS_PER_DEGREE, LON_CELLS, CELLS_PER_DEGREE, 180 * CELLS_PER_DEGREE))
+
+
+def grid_row(lat: float) -> int:
+    return floor(lat * CELLS_PER_DEGREE) + 90 * CELLS_PER_DEGREE
+
+
+def grid_column(lon: float) -> int:
+    return floor(lon * CELLS_PER_DEGREE) + 180 * CELLS_PER_DEGREE
+
+
+def grid_cell(lat: float, lon: float) -> int:
+    return grid_row(lat) * LON_CELLS + grid_column(lon)
+
+
+def cell_ranges(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> list[tuple[int, int]]:
+    # The cells covering the box, as one contiguous (first, last) range per grid row.
+    first_row, last_row = grid_row(min_lat), grid_row(max_lat)
+    first_column, last_column = grid_column(min_lon), grid_column(max_lon)
+    if last_row - first_row >= MAX_CELL_RANGES:
+        return [(first_row * LON_CELLS + first_column, last_row * LON_CELLS + last_column)]
+    return [(row * LON_CELLS + first_column, row * LON_CELLS + last_column)
+            for row in range(first_row, last_row + 1)]
+
+
+def bbox_predicate(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                   table: str = "TrackPoint") -> tuple[str, list]:
+    # WHERE clause and parameters for points in the half-open box [min_lat, max_lat) x [min_lon, max_lon).
+    # The grid_cell ranges use the index; the exact lat/lon bounds remove the cells' overhang.
+    ranges = cell_ranges(min_lat, min_lon, max_lat, max_lon)
+    clause = "(" + " OR ".join(["%s.grid_cell BETWEEN %%s AND %%s" % table] * len(ranges)) + ")"
+    clause += " AND {0}.lat >= %s AND {0}.lat < %s AND {0}.lon >= %s AND {0}.lon < %s".format(table)
+    params = [cell for cell_range in ranges for cell in cell_range]
+    params += [min_lat, max_lat, min_lon, max_lon]
+    return clause, params
+
+
+def radius_predicate(lat: float, lon: float, radius_km: float, table: str = "TrackPoint") -> tuple[str, list]:
+    # Bounding box of the circle for the index, then the exact haversine distance.
+    lat_delta = degrees(radius_km / EARTH_RADIUS_KM)
+    lon_delta = degrees(asin(min(1.0, sin(radius_km / EARTH_RADIUS_KM) / max(cos(radians(lat)), 1e-12))))
+    clause, params = bbox_predicate(lat - lat_delta, lon - lon_delta, lat + lat_delta, lon + lon_delta, table)
+    clause += (" AND 2 * %s * ASIN(SQRT(POW(SIN(RADIANS({0}.lat - %s) / 2), 2)"
+               " + COS(RADIANS(%s)) * COS(RADIANS({0}.lat)) * POW(SIN(RADIANS({0}.lon - %s) / 2), 2))) <= %s"
+               ).format(table)
+    params += [EARTH_RADIUS_KM, lat, lat, lon, radius_km]
+    return clause, params
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+import argparse
+import os
+import random
+
+from plt_parser import HEADER_LINES, MAX_LINES, PLT_EPOCH
+
+PLT_HEADER = ["Geolife trajectory", "WGS 84", "Altitude is in Feet", "Reserved 3",
+              "0,2,255,My Track,0,0,2,8421376", "0"]
+TRANSPORTATION_MODES = ["walk", "bus", "car", "taxi", "subway", "bike", "train"]
+
+
+def write_plt_file(filename: str, start_time: datetime, points: int, rng: random.Random) -> datetime:
+    # A random walk around Beijing, one point every 1-5 seconds with the odd 5+ minute gap.
+    # Returns the timestamp of the last point.
+    lat = 39.9 + rng.uniform(-0.1, 0.1)
+    lon = 116.4 + rng.uniform(-0.1, 0.1)
+    altitude = rng.randint(50, 300)
+    current_time = start_time
+    lines = list(PLT_HEADER)
+    for i in range(points):
+        if i:
+            current_time += timedelta(seconds=rng.choice([1, 2, 5]) if rng.random() > 0.002 else 400)
+            lat += rng.uniform(-0.0002, 0.0002)
+            lon += rng.uniform(-0.0002, 0.0002)
+            altitude += rng.randint(-3, 3)
+        days = (current_time - PLT_EPOCH).total_seconds() / 86400
+        shown_altitude = -777 if rng.random() < 0.01 else altitude
+        lines.append(f"{lat:.6f},{lon:.6f},0,{shown_altitude},{days:.10f},"
+                     f"{current_time:%Y-%m-%d},{current_time:%H:%M:%S}")
+    with open(filename, "w") as file:
+        file.write("\n".join(lines) + "\n")
+    return current_time
+
+
+def generate(directory: str, users: int = 10, files_per_user: int = 20, points_per_file: int = 500,
+             invalid_share: float = 0.1, labelled_share: float = 0.5, seed: int = 0) -> dict:
+    # Writes a Geolife-shaped tree: directory/Data/<user>/Trajectory/*.plt, labels.txt for the
+    # labelled users (matching about half of their files exactly) and directory/labeled_ids.txt.
+    # Invalid files are either too short or longer than MAX_LINES. Returns the generated counts.
+    rng = random.Random(seed)
+    labelled_users = []
+    stats = {"users": users, "files": 0, "valid_files": 0, "points": 0, "labels": 0}
+    for user_number in range(users):
+        user = f"{user_number:03d}"
+        trajectory_directory = os.path.join(directory, "Data", user, "Trajectory")
+        os.makedirs(trajectory_directory, exist_ok=True)
+        labelled = rng.random() < labelled_share
+        labels = []
+        start_time = datetime(2007, 1, 1) + timedelta(days=rng.randint(0, 1000))
+        for _ in range(files_per_user):
+            if rng.random() < invalid_share:
+                points = rng.choice([0, MAX_LINES - HEADER_LINES + 1 + rng.randint(0, 500)])
+            else:
+                points = max(1, int(rng.gauss(points_per_file, points_per_file / 4)))
+                points = min(points, MAX_LINES - HEADER_LINES)
+            filename = os.path.join(trajectory_directory, f"{start_time:%Y%m%d%H%M%S}.plt")
+            end_time = write_plt_file(filename, start_time, points, rng)
+            stats["files"] += 1
+            if 0 < points <= MAX_LINES - HEADER_LINES:
+                stats["valid_files"] += 1
+                stats["points"] += points
+                if labelled and rng.random() < 0.5:
+                    labels.append((start_time, end_time, rng.choice(TRANSPORTATION_MODES)))
+            start_time = end_time + timedelta(hours=rng.randint(1, 72))
+        if labelled:
+            labelled_users.append(user)
+            stats["labels"] += len(labels)
+            with open(os.path.join(directory, "Data", user, "labels.txt"), "w") as file:
+                file.write("Start Time\tEnd Time\tTransportation Mode\n")
+                for label_start, label_end, mode in labels:
+                    file.write(f"{label_start:%Y/%m/%d %H:%M:%S}\t{label_end:%Y/%m/%d %H:%M:%S}\t{mode}\n")
+    with open(os.path.join(directory, "labeled_ids.txt"), "w") as file:
+        file.write("".join(user + "\n" for user in labelled_users))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Geolife dataset")
+    parser.add_argument("directory")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--files-per-user", type=int, default=20)
+    parser.add_argument("--points-per-file", type=int, default=500)
+    parser.add_argument("--invalid-share", type=float, default=0.1)
+    parser.add_argument("--labelled-share", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(generate(args.directory, args.users, args.files_per_user, args.points_per_file,
+                   args.invalid_share, args.labelled_share, args.seed))
+
+
+if __name__ == '__main__':
+    main()
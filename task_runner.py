@@ -0,0 +1,120 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import argparse
+import io
+import json
+import sys
+import threading
+import time
+
+from DbConnector import DbConnector, PooledConnector, PASSWORD
+from geolife import ExampleProgram
+
+TASKS = ["task_1", "task_2", "task_3", "task_4", "task_5", "task_6a", "task_6b",
+         "task_7", "task_8", "task_9", "task_10", "task_11"]
+
+
+def run_task(connector: DbConnector, task: str, dataset_directory: str, cache_results: bool,
+             running: dict, lock: threading.Lock) -> dict:
+    # Worker thread: runs one task on its own pooled connection and captures the printed report.
+    worker = PooledConnector(connector)
+    start = time.perf_counter()
+    with lock:
+        running[task] = (worker.connection_id, start)
+    try:
+        program = ExampleProgram(dataset_directory=dataset_directory, connection=worker,
+                                 cache_results=cache_results)
+        program.output = io.StringIO()
+        rows = getattr(program, task)()
+        return {"task": task, "status": "ok", "rows": rows, "report": program.output.getvalue(),
+                "seconds": time.perf_counter() - start}
+    finally:
+        with lock:
+            running.pop(task, None)
+        worker.close_connection()
+
+
+def run_tasks(connector: DbConnector, tasks: list[str], workers: int = 4, timeout: float | None = None,
+              dataset_directory: str = "dataset/dataset", cache_results: bool = True) -> list[dict]:
+    # Runs the tasks concurrently, at most `workers` at a time, and returns one result per task in
+    # the order given. A task still running after `timeout` seconds has its statement cancelled
+    # with KILL QUERY from the connector's own connection; it is reported as "timeout".
+    if workers > connector.pool_size:
+        raise ValueError("workers (%d) is larger than the connection pool (%d)" % (workers, connector.pool_size))
+    running: dict[str, tuple[int, float]] = {}
+    killed = set()
+    lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {task: executor.submit(run_task, connector, task, dataset_directory, cache_results,
+                                         running, lock) for task in tasks}
+        pending = set(futures.values())
+        while pending:
+            _, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            if timeout is None:
+                continue
+            now = time.perf_counter()
+            # Killed under the lock: a worker leaves `running` before returning its connection to
+            # the pool, so the id can not belong to another task's query yet.
+            with lock:
+                for task, (connection_id, start) in running.items():
+                    if now - start > timeout and task not in killed:
+                        killed.add(task)
+                        connector.cursor.execute("KILL QUERY %d" % connection_id)
+    finally:
+        executor.shutdown()
+
+    results = []
+    for task in tasks:
+        try:
+            result = futures[task].result()
+            if task in killed:
+                # Finished after all, e.g. in client-side work once its last query was done.
+                result["status"] = "timeout"
+        except Exception as e:
+            result = {"task": task, "status": "timeout" if task in killed else "error", "error": str(e)}
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Geolife tasks concurrently, one pooled connection per worker")
+    parser.add_argument("tasks", nargs="*", help="tasks to run, any of %s (default: all of them)" % ", ".join(TASKS))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=None, help="seconds before a task's query is killed")
+    parser.add_argument("--no-cache", action="store_true", help="recompute every task instead of using TaskResult")
+    parser.add_argument("--dataset-directory", default="dataset/dataset")
+    parser.add_argument("--backend", choices=["mysql", "sqlite", "duckdb"], default="mysql")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--database", default="local_db")
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default=PASSWORD)
+    parser.add_argument("--json", default=None, help="also write the results as JSON to this file")
+    args = parser.parse_args()
+    # Checked by hand: with choices, an empty positional list is itself rejected as a choice.
+    unknown = [task for task in args.tasks if task not in TASKS]
+    if unknown:
+        parser.error("unknown tasks: %s (choose from %s)" % (", ".join(unknown), ", ".join(TASKS)))
+    tasks = args.tasks or TASKS
+    connector = DbConnector(HOST=args.host, DATABASE=args.database, USER=args.user, PASSWORD=args.password,
+                            POOL_SIZE=max(args.workers, 1), BACKEND=args.backend)
+    start = time.perf_counter()
+    try:
+        results = run_tasks(connector, tasks, args.workers, args.timeout,
+                            args.dataset_directory, not args.no_cache)
+    finally:
+        connector.close_connection()
+    for result in results:
+        if result["status"] == "ok":
+            print("%s (%.2f s)" % (result["task"], result["seconds"]))
+            sys.stdout.write(result["report"])
+        else:
+            print("%s: %s %s" % (result["task"], result["status"].upper(), result.get("error", "")))
+        print()
+    print("Ran %d tasks with %d workers in %.2f s" % (len(results), args.workers, time.perf_counter() - start))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
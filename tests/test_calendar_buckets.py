@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import pytest
+
+import calendar_buckets
+from DbConnector import DbConnector
+from geolife import ExampleProgram
+
+# Activities crossing hour, day, week, month and year boundaries, plus a zero-length one. They
+# span ten weeks so the hourly CalendarBucket table stays small.
+ACTIVITIES = [
+    (datetime(2008, 12, 31, 22, 30), datetime(2009, 1, 1, 1, 15)),
+    (datetime(2009, 1, 31, 23, 50), datetime(2009, 2, 1, 0, 20)),
+    (datetime(2009, 3, 1, 10, 0), datetime(2009, 3, 1, 10, 0)),
+    (datetime(2009, 3, 8, 23, 0), datetime(2009, 3, 9, 2, 0)),
+    (datetime(2009, 2, 15, 12, 0, 30), datetime(2009, 2, 15, 12, 59, 59)),
+    (datetime(2009, 1, 20, 18, 0), datetime(2009, 3, 2, 6, 0)),
+]
+
+
+@pytest.fixture(params=["sqlite", "duckdb"])
+def program(request, tmp_path):
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb")
+    connection = DbConnector(DATABASE=str(tmp_path / "geolife"), BACKEND=request.param)
+    program = ExampleProgram(dataset_directory=str(tmp_path), connection=connection, cache_results=False)
+    program.create_tables()
+    program.cursor.execute("INSERT INTO User (id, has_labels) VALUES ('000', 0)")
+    program.cursor.executemany(
+        "INSERT INTO Activity (user_id, transportation_mode, start_date_time, end_date_time) VALUES (%s, %s, %s, %s)",
+        [("000", None, start, end) for start, end in ACTIVITIES])
+    program.db_connection.commit()
+    yield program
+    connection.close_connection()
+
+
+@pytest.mark.parametrize("unit", list(calendar_buckets.UNITS))
+def test_numpy_and_sql_buckets_agree(program, unit):
+    numpy_rows = program.activity_buckets(unit, "numpy")
+    sql_rows = program.activity_buckets(unit, "sql")
+    assert [row[:2] for row in numpy_rows] == [row[:2] for row in sql_rows]
+    assert [row[2] for row in numpy_rows] == pytest.approx([row[2] for row in sql_rows])
+
+
+def test_year_buckets_split_hours_at_the_boundary():
+    buckets = calendar_buckets.CalendarBuckets("year")
+    buckets.add([ACTIVITIES[0][0]], [ACTIVITIES[0][1]])
+    assert [row[:2] for row in buckets.rows()] == [(2008, 1), (2009, 1)]
+    assert [row[2] for row in buckets.rows()] == pytest.approx([1.5, 1.25])
+
+
+def test_hours_add_up_to_the_activity_durations():
+    buckets = calendar_buckets.CalendarBuckets("day")
+    starts, ends = zip(*ACTIVITIES)
+    buckets.add(starts, ends)
+    total = sum((end - start).total_seconds() for start, end in ACTIVITIES) / 3600
+    assert sum(row[2] for row in buckets.rows()) == pytest.approx(total)
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+import random
+
+import pytest
+
+import trajectory
+from simplify import Simplification, drop_duplicate_timestamps
+
+
+def jittered_walk(points=2000, seed=1):
+    # A straight walk north, one point a second, with a few metres of GPS noise on every fix.
+    rng = random.Random(seed)
+    start = datetime(2008, 5, 1, 8)
+    rows = []
+    for i in range(points):
+        lat = 39.9 + i * 0.00001 + rng.gauss(0, 0.00002)
+        lon = 116.4 + rng.gauss(0, 0.00002)
+        altitude = 100 + i // 100 + rng.choice([-1, 0, 1])
+        rows.append(("%.6f" % lat, "%.6f" % lon, str(altitude), start + timedelta(seconds=i), 0))
+    return rows
+
+
+def with_duplicates(rows):
+    # One repeat right after its original and one much later in the file.
+    return rows[:10] + [rows[9]] + rows[10:500] + [rows[3]] + rows[500:]
+
+
+@pytest.mark.parametrize("method", ["douglas_peucker", "tolerance"])
+def test_default_settings_drop_points(method):
+    rows = jittered_walk()
+    kept, summary = Simplification(METHOD=method).apply(rows)
+    assert len(kept) < len(rows) / 2
+    assert summary[0] == len(kept)
+    assert summary[9] == len(rows)
+
+
+def test_summary_figures_come_from_all_points():
+    rows = jittered_walk()
+    _, summary = Simplification().apply(rows)
+    assert summary[1:9] == trajectory.summarize_rows(rows)[1:]
+
+
+def test_errors_are_measured_against_the_kept_points():
+    rows = jittered_walk()
+    kept, summary = Simplification().apply(rows)
+    kept_summary = trajectory.summarize_rows(kept)
+    assert summary[10] == pytest.approx(summary[1] - kept_summary[1])
+    assert summary[11] == pytest.approx(summary[2] - kept_summary[2])
+
+
+@pytest.mark.parametrize("method", ["dedupe", "douglas_peucker", "tolerance"])
+def test_duplicate_timestamps_are_dropped(method):
+    rows = with_duplicates(jittered_walk())
+    kept, summary = Simplification(METHOD=method).apply(rows)
+    timestamps = [row[3] for row in kept]
+    assert len(timestamps) == len(set(timestamps))
+    assert summary[9] == len(rows)
+
+
+def test_dedupe_keeps_every_distinct_timestamp():
+    rows = jittered_walk()
+    kept, _ = Simplification(METHOD="dedupe").apply(with_duplicates(rows))
+    assert kept == rows
+
+
+def test_limit_fallback_still_drops_duplicates():
+    rows = with_duplicates(jittered_walk())
+    kept, summary = Simplification(MAX_DISTANCE_ERROR=0.0).apply(rows)
+    assert kept == drop_duplicate_timestamps(rows)
+    assert len(kept) == len(rows) - 2
+    assert summary[10] == pytest.approx(summary[1] - trajectory.summarize_rows(kept)[1])
+
+
+def test_relative_limits_decide_between_simplified_and_deduped_rows():
+    rows = jittered_walk()
+    _, unlimited = Simplification().apply(rows)
+    distance_error = abs(unlimited[10]) / unlimited[1]
+    altitude_error = abs(unlimited[11]) / unlimited[2]
+
+    kept, _ = Simplification(MAX_DISTANCE_ERROR=distance_error * 1.01,
+                             MAX_ALTITUDE_GAIN_ERROR=altitude_error * 1.01).apply(rows)
+    assert len(kept) == unlimited[0]
+
+    kept, _ = Simplification(MAX_DISTANCE_ERROR=distance_error * 0.99).apply(rows)
+    assert len(kept) == len(rows)
+
+    kept, _ = Simplification(MAX_ALTITUDE_GAIN_ERROR=altitude_error * 0.99).apply(rows)
+    assert len(kept) == len(rows)
+
+
+def test_no_new_time_gaps():
+    rows = jittered_walk()
+    rows = rows[:1000] + [(*row[:3], row[3] + timedelta(minutes=10), row[4]) for row in rows[1000:]]
+    kept, summary = Simplification(MAX_INTERVAL_S=30).apply(rows)
+    gaps = [(b[3] - a[3]).total_seconds() for a, b in zip(kept, kept[1:])]
+    assert max(gap for gap in gaps if gap < 600) <= 30
+    assert max(gaps) == summary[3]
+
+
+def test_altitude_tolerance_keeps_a_climb():
+    # Standing still while climbing 20 units and back down, all inside one MAX_INTERVAL_S:
+    # without the altitude test every point but the ends lies on the line and the climb disappears.
+    start = datetime(2008, 5, 1, 8)
+    altitudes = list(range(100, 120)) + list(range(120, 99, -1))
+    rows = [("39.900000", "116.400000", str(altitude), start + timedelta(seconds=i), 0)
+            for i, altitude in enumerate(altitudes)]
+    _, flat = Simplification(ALTITUDE_TOLERANCE=None).apply(rows)
+    _, climbing = Simplification(ALTITUDE_TOLERANCE=5.0).apply(rows)
+    assert flat[11] == pytest.approx(20)
+    assert climbing[11] == pytest.approx(0)
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        Simplification(METHOD="fastest")
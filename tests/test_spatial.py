@@ -0,0 +1,63 @@
+import random
+import sqlite3
+
+import pytest
+
+import spatial
+
+# The box task_10 used to select with lat LIKE '39.916%' AND lon LIKE '116.397%'.
+TASK_10_BOX = (39.916, 116.397, 39.917, 116.398)
+
+
+def points(seed=1):
+    # Six-decimal points as stored by the parser around the task_10 box, plus every combination of
+    # its edges and values just inside and outside them.
+    rng = random.Random(seed)
+    lats = [round(rng.uniform(39.914, 39.919), 6) for _ in range(3000)] + [39.916, 39.9169995, 39.917, 39.915999]
+    lons = [round(rng.uniform(116.395, 116.4), 6) for _ in range(3000)] + [116.397, 116.3979995, 116.398, 116.396999]
+    edges = [(lat, lon) for lat in lats[-4:] for lon in lons[-4:]]
+    return list(zip(lats, lons)) + edges
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE TrackPoint (id INTEGER PRIMARY KEY, lat REAL, lon REAL, grid_cell INTEGER)")
+    connection.executemany("INSERT INTO TrackPoint (lat, lon, grid_cell) VALUES (?, ?, ?)",
+                           [(lat, lon, spatial.grid_cell(lat, lon)) for lat, lon in points()])
+    yield connection
+    connection.close()
+
+
+def selected(connection, clause, params):
+    query = "SELECT id FROM TrackPoint WHERE %s ORDER BY id" % clause.replace("%s", "?")
+    return [row[0] for row in connection.execute(query, params)]
+
+
+def test_bbox_matches_the_like_prefixes(connection):
+    like = selected(connection, "TrackPoint.lat LIKE '39.916%' AND TrackPoint.lon LIKE '116.397%'", [])
+    assert like
+    assert selected(connection, *spatial.bbox_predicate(*TASK_10_BOX)) == like
+
+
+def test_bbox_is_half_open(connection):
+    min_lat, min_lon, max_lat, max_lon = TASK_10_BOX
+    clause, params = spatial.bbox_predicate(*TASK_10_BOX)
+    rows = connection.execute("SELECT lat, lon FROM TrackPoint WHERE %s" % clause.replace("%s", "?"), params).fetchall()
+    assert (min_lat, min_lon) in rows
+    assert all(min_lat <= lat < max_lat and min_lon <= lon < max_lon for lat, lon in rows)
+
+
+@pytest.mark.parametrize("box", [(39.9145, 116.3955, 39.9185, 116.3985), (39.0, 116.0, 40.0, 117.0)])
+def test_bbox_matches_a_full_scan(connection, box):
+    min_lat, min_lon, max_lat, max_lon = box
+    scan = [row[0] for row in connection.execute(
+        "SELECT id FROM TrackPoint WHERE lat >= ? AND lat < ? AND lon >= ? AND lon < ? ORDER BY id",
+        (min_lat, max_lat, min_lon, max_lon))]
+    assert selected(connection, *spatial.bbox_predicate(*box)) == scan
+
+
+def test_wide_boxes_use_a_single_cell_range():
+    clause, params = spatial.bbox_predicate(30.0, 110.0, 45.0, 120.0)
+    assert clause.count("BETWEEN") == 1
+    assert len(params) == 6
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+# Filters such as YEAR(date_time) = 2008 wrap the column in a function, so MySQL can neither use
+# an index on it nor prune the year partitions of TrackPoint. The same filters written as half-open
+# ranges on the bare column, date_time >= '2008-01-01' AND date_time < '2009-01-01', can do both,
+# so callers build them with year_range() and range_predicate().
+# Geolife runs from 2007 to 2012; older and newer points go to the first and last partition.
+PARTITION_YEARS = range(2008, 2013)
+
+
+def year_range(first_year: int, last_year: int | None = None) -> tuple[datetime, datetime]:
+    # [first_year-01-01, (last_year + 1)-01-01), the range equivalent of YEAR(column) BETWEEN first AND last.
+    return datetime(first_year, 1, 1), datetime((last_year or first_year) + 1, 1, 1)
+
+
+def range_predicate(column: str, start: datetime | None = None, end: datetime | None = None) -> tuple[str, list]:
+    # WHERE clause and parameters for start <= column < end; either bound may be left open.
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append("%s >= %%s" % column)
+        params.append(start)
+    if end is not None:
+        conditions.append("%s < %%s" % column)
+        params.append(end)
+    return " AND ".join(conditions) or "TRUE", params
+
+
+def year_partitions_sql(column: str = "date_time", years: range = PARTITION_YEARS) -> str:
+    # PARTITION BY RANGE COLUMNS clause with one partition per year. Range predicates on the bare
+    # column prune to the partitions they overlap.
+    partitions = ["PARTITION p%d VALUES LESS THAN ('%d-01-01')" % (year - 1, year) for year in years]
+    partitions.append("PARTITION p%d VALUES LESS THAN (MAXVALUE)" % years[-1])
+    return "PARTITION BY RANGE COLUMNS(%s) (\n    %s\n)" % (column, ",\n    ".join(partitions))
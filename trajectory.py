@@ -0,0 +1,98 @@
+import numpy as np
+
+# Same mean earth radius as the haversine package, so results match haversine() per pair.
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def activity_distances(activity_ids: np.ndarray, lat: np.ndarray, lon: np.ndarray) -> dict[int, float]:
+    # Points must be ordered by (activity_id, date_time). A segment is a pair of consecutive
+    # points; pairs that cross an activity boundary are dropped before summing per activity.
+    if len(activity_ids) == 0:
+        return {}
+    ids, index = np.unique(activity_ids, return_inverse=True)
+    distances = np.zeros(len(ids))
+    if len(activity_ids) > 1:
+        same_activity = activity_ids[1:] == activity_ids[:-1]
+        segments = haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        distances = np.bincount(index[1:][same_activity], weights=segments[same_activity], minlength=len(ids))
+    return dict(zip(ids.tolist(), distances.tolist()))
+
+
+def group_distances(distances: dict[int, float], groups: dict[int, object]) -> dict[object, float]:
+    # Sums per-activity distances by any activity attribute, e.g. user id or transportation mode.
+    totals = {}
+    for activity_id, distance in distances.items():
+        key = groups[activity_id]
+        totals[key] = totals.get(key, 0.0) + distance
+    return totals
+
+
+def rows_to_arrays(rows: list[tuple]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # (activity_id, lat, lon) rows into three column arrays.
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+    data = np.array(rows, dtype=np.float64)
+    return data[:, 0].astype(np.int64), data[:, 1], data[:, 2]
+
+
+class ActivityDistances:
+    """
+    Sums kilometres per activity over (activity_id, lat, lon) rows ordered by
+    (activity_id, date_time) that arrive in chunks, e.g. from fetchmany(). Each chunk is turned
+    into arrays and summed as it comes; only the last point is carried over, so the segment
+    across a chunk edge is counted and memory stays at one chunk.
+
+    Example:
+    distances = ActivityDistances()
+    distances.add(cursor.fetchmany(100000)) // until the cursor is exhausted
+    distances.distances // {activity_id: km}
+    """
+
+    def __init__(self):
+        self.distances: dict[int, float] = {}
+        self.last_point: tuple[int, float, float] | None = None
+
+    def add(self, rows: list[tuple]) -> None:
+        activity_ids, lat, lon = rows_to_arrays(rows)
+        if len(activity_ids) == 0:
+            return
+        if self.last_point is not None:
+            last_id, last_lat, last_lon = self.last_point
+            activity_ids = np.concatenate([[last_id], activity_ids])
+            lat = np.concatenate([[last_lat], lat])
+            lon = np.concatenate([[last_lon], lon])
+        for activity_id, distance in activity_distances(activity_ids, lat, lon).items():
+            self.distances[activity_id] = self.distances.get(activity_id, 0.0) + distance
+        self.last_point = (int(activity_ids[-1]), float(lat[-1]), float(lon[-1]))
+
+
+def stored_altitude(altitude: np.ndarray) -> np.ndarray:
+    # TrackPoint.altitude is an INT column, and MySQL rounds fractional values half away from
+    # zero when storing them. Summaries round the same way, so they agree with the reports that
+    # read the stored altitudes.
+    return np.sign(altitude) * np.floor(np.abs(altitude) + 0.5)
+
+
+def summarize_rows(rows: list[tuple]) -> tuple:
+    # Per-activity figures that never change once the activity is loaded, from its
+    # (lat, lon, altitude, date_time, ...) rows: point count, distance in km, altitude gain
+    # over valid (not -777) altitudes, largest time gap and duration in seconds, and bounding box.
+    rows = sorted(rows, key=lambda row: row[3])
+    lat = np.array([float(row[0]) for row in rows])
+    lon = np.array([float(row[1]) for row in rows])
+    altitude = stored_altitude(np.array([float(row[2]) for row in rows]))
+    seconds = np.array([(row[3] - rows[0][3]).total_seconds() for row in rows])
+    distance = float(haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum())
+    valid_altitude = altitude[altitude != -777]
+    altitude_deltas = np.diff(valid_altitude)
+    altitude_gain = float(altitude_deltas[altitude_deltas > 0].sum())
+    max_gap = int(np.diff(seconds).max()) if len(rows) > 1 else 0
+    return (len(rows), distance, altitude_gain, max_gap,
+            float(lat.min()), float(lat.max()), float(lon.min()), float(lon.max()),
+            int(seconds[-1] - seconds[0]))